@@ -0,0 +1,314 @@
+"""
+Нагрузочный тест хендлеров: синтетические апдейты идут через настоящий Dispatcher
+(main.create_dispatcher — middleware, FSM-хранилище, роутеры register_all_handlers),
+Bot API подменён сессией-заглушкой, база — временный SQLite-файл.
+
+Каждый виртуальный пользователь проходит полный сценарий:
+/start → «Силовые» → анкета профиля → онбординг → «Новая тренировка» (ждём задачу в очереди планов)
+→ plan:ex:N → ввод повторов → «Назад»
+(последние четыре шага повторяются --rounds раз). Пользователи работают конкурентно.
+С --ai вместо локального плана — «Новая AI тренировка»: OpenAI подменён клиентом-заглушкой,
+который отдаёт готовый план потоком (как при OPENAI_STREAM=1) кусками с задержкой --llm-latency.
+
+    python bench/load_test.py --users 50 --rounds 3 --api-latency 30
+    python bench/load_test.py --users 50 --ai --llm-latency 20
+
+Отчёт: апдейтов/с, латентность по хендлерам (p50/p95/p99/max, SQLite на апдейт), задержка event loop
+(если хендлер блокирует цикл — БД, планировщик, — она вырастет первой) и вызовы Bot API.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_USER_BASE = 10_000_000
+
+
+def _configure_env(users: int, db_path: str, ai: bool = False):
+    # до импорта config: временная БД, тестовый токен, все виртуальные пользователи — админы
+    os.environ["DB_URL"] = db_path
+    os.environ["BOT_TOKEN"] = "42:LOADTEST"
+    os.environ["ADMIN_IDS"] = ",".join(str(_USER_BASE + i) for i in range(users))
+    if ai:
+        os.environ["OPENAI_API_KEY"] = "sk-loadtest"   # запросы уходят в make_fake_openai, не в сеть
+        os.environ["OPENAI_CACHE_TTL"] = "0"   # у виртуальных пользователей одинаковые payload'ы — без кеша каждый план идёт потоком
+
+
+# --- Bot API stub -------------------------------------------------------------
+
+def make_fake_session(api_latency: float):
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import AnswerCallbackQuery, EditMessageText, SendMessage
+    from aiogram.types import Message
+
+    class FakeSession(BaseSession):
+        """Отвечает на методы Bot API локально, с задержкой api_latency; запоминает последний текст в чате."""
+
+        def __init__(self):
+            super().__init__()
+            self.calls: Counter = Counter()
+            self.last_text: dict[int, str] = {}
+            self._ids = itertools.count(1)
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[type(method).__name__] += 1
+            if api_latency:
+                await asyncio.sleep(api_latency)
+            if isinstance(method, (SendMessage, EditMessageText)):
+                chat_id = int(method.chat_id)
+                self.last_text[chat_id] = method.text
+                if isinstance(method, EditMessageText):
+                    return True
+                return Message.model_validate({
+                    "message_id": next(self._ids), "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"}, "text": method.text,
+                }, context={"bot": bot})
+            if isinstance(method, AnswerCallbackQuery):
+                return True
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            # скачивание файлов (bot.download): отдаём заготовку кусками по chunk_size
+            self.calls["stream_content"] += 1
+            if api_latency:
+                await asyncio.sleep(api_latency)
+            for i in range(0, len(CANNED_FILE), chunk_size):
+                yield CANNED_FILE[i:i + chunk_size]
+
+        async def close(self):
+            pass
+
+    return FakeSession()
+
+
+CANNED_FILE = b"loadtest file " * 1024
+
+
+# --- OpenAI stub --------------------------------------------------------------
+
+# план по PLAN_SCHEMA: 4 упражнения — сценарий открывает plan:ex:1..4
+CANNED_PLAN = json.dumps({"items": [
+    {"name": name, "set": s, "weight": weight, "reps": 8}
+    for name, weight in (("Жим штанги лёжа", 80), ("Жим узким хватом", 60), ("Отжимания на брусьях", 0), ("Пресс", 0))
+    for s in (1, 2, 3)
+]}, ensure_ascii=False)
+
+
+def make_fake_openai(chunk_latency: float, chunk_chars: int = 40):
+    """Вместо AsyncOpenAI: chat.completions.create отдаёт CANNED_PLAN — потоком или целиком."""
+    from types import SimpleNamespace as NS
+
+    async def chunks():
+        for i in range(0, len(CANNED_PLAN), chunk_chars):
+            if chunk_latency:
+                await asyncio.sleep(chunk_latency)
+            yield NS(choices=[NS(delta=NS(content=CANNED_PLAN[i:i + chunk_chars]))])
+
+    async def create(*, stream: bool = False, **kwargs):
+        if stream:
+            return chunks()
+        if chunk_latency:
+            await asyncio.sleep(chunk_latency * (len(CANNED_PLAN) // chunk_chars + 1))
+        return NS(choices=[NS(message=NS(content=CANNED_PLAN))])
+
+    async def close():
+        pass
+
+    return NS(chat=NS(completions=NS(create=create)), close=close)
+
+
+# --- latency ------------------------------------------------------------------
+
+class HandlerTimer:
+    """Inner-middleware: время каждого хендлера (по имени функции) вместе с его запросами к БД и Bot API."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    async def __call__(self, handler, event, data):
+        name = getattr(data.get("handler"), "callback", handler).__name__
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.samples[name].append(time.perf_counter() - t0)
+
+
+async def loop_lag_monitor(samples: list[float], interval: float = 0.01):
+    """Насколько позже запланированного просыпается цикл — мера блокирующих вызовов."""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - t0 - interval)
+
+
+def _pct(values: list[float], q: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))] if s else 0.0
+
+
+# --- scenario -----------------------------------------------------------------
+
+PROFILE_ANSWERS = ("Тест", "30", "180", "80", "м", "сила", "средний")
+ONBOARD_ANSWERS = ("100", "85", "140", "10", "170", "60", "15")
+
+
+class VirtualUser:
+    def __init__(self, idx: int, bot, dp, session, update_ids, latencies: list[float], ai: bool = False):
+        self.uid = _USER_BASE + idx
+        self.new_plan = "Новая AI тренировка" if ai else "Новая тренировка"
+        self.bot, self.dp, self.session = bot, dp, session
+        self.update_ids = update_ids
+        self.latencies = latencies
+        self._msg_ids = itertools.count(1)
+
+    def _base(self) -> dict:
+        return {
+            "message_id": next(self._msg_ids), "date": int(time.time()),
+            "chat": {"id": self.uid, "type": "private"},
+            "from": {"id": self.uid, "is_bot": False, "first_name": f"User{self.uid}"},
+        }
+
+    async def _feed(self, payload: dict):
+        from aiogram.types import Update
+        update = Update.model_validate({"update_id": next(self.update_ids), **payload}, context={"bot": self.bot})
+        t0 = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.latencies.append(time.perf_counter() - t0)
+
+    async def text(self, text: str):
+        await self._feed({"message": {**self._base(), "text": text}})
+
+    async def press(self, data: str):
+        msg = self._base()
+        await self._feed({"callback_query": {
+            "id": f"{self.uid}-{msg['message_id']}", "chat_instance": str(self.uid),
+            "from": msg["from"], "message": {**msg, "from": {"id": 42, "is_bot": True, "first_name": "bot"}, "text": "…"},
+            "data": data,
+        }})
+
+    async def run(self, rounds: int):
+        await self.text("/start")
+        await self.press("start:type:strength")
+        for answer in PROFILE_ANSWERS + ONBOARD_ANSWERS:
+            await self.text(answer)
+        from handlers.plan import PLAN_JOBS
+        for r in range(rounds):
+            await self.text(self.new_plan)
+            await PLAN_JOBS.wait(self.uid)  # план составляется в фоновой очереди
+            await self.press(f"plan:ex:{r % 4 + 1}")
+            sets = len(re.findall(r"^Подход \d+", self.session.last_text.get(self.uid, ""), flags=re.M))
+            await self.text(" ".join(["8"] * max(sets, 1)))
+            await self.press("plan:back")
+
+
+# --- runner -------------------------------------------------------------------
+
+async def run(users: int, rounds: int, api_latency: float, verbose: bool,
+              ai: bool = False, llm_latency: float = 0.0) -> dict:
+    from aiogram import Bot
+    from db import init_db, close_db
+    from main import create_dispatcher
+    from services import metrics, openai_client
+
+    init_db()
+    if ai:
+        fake = make_fake_openai(llm_latency)
+        openai_client.get_async_openai_client = lambda: fake
+    session = make_fake_session(api_latency)
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    dp = create_dispatcher()
+    timer = HandlerTimer()
+    dp.message.middleware(timer)
+    dp.callback_query.middleware(timer)
+
+    latencies: list[float] = []
+    lag: list[float] = []
+    update_ids = itertools.count(1)
+    monitor = asyncio.create_task(loop_lag_monitor(lag))
+    vusers = [VirtualUser(i, bot, dp, session, update_ids, latencies, ai=ai) for i in range(users)]
+
+    out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    t0 = time.perf_counter()
+    with out:
+        await asyncio.gather(*(u.run(rounds) for u in vusers))
+    wall = time.perf_counter() - t0
+    monitor.cancel()
+    await close_db()
+    db_by_handler = metrics.snapshot()["handlers"]
+
+    return {
+        "users": users, "rounds": rounds, "api_latency_ms": api_latency * 1000,
+        "wall_s": wall, "updates": len(latencies), "updates_per_s": len(latencies) / wall,
+        "update_p50_ms": _pct(latencies, 0.5) * 1000, "update_p99_ms": _pct(latencies, 0.99) * 1000,
+        "loop_lag_p99_ms": _pct(lag, 0.99) * 1000, "loop_lag_max_ms": max(lag, default=0.0) * 1000,
+        "handlers": {
+            name: {"count": len(v), "p50_ms": statistics.median(v) * 1000, "p95_ms": _pct(v, 0.95) * 1000,
+                   "p99_ms": _pct(v, 0.99) * 1000, "max_ms": max(v) * 1000,
+                   # из services.metrics: SQLite на апдейт (время с ожиданием потока БД и число запросов)
+                   "db_ms": db_by_handler.get(name, {}).get("db_seconds", 0) / len(v) * 1000,
+                   "db_queries": db_by_handler.get(name, {}).get("db_queries", 0) / len(v)}
+            for name, v in sorted(timer.samples.items())
+        },
+        # фоновые задачи очереди планов (handlers.plan.PLAN_JOBS) — свои «апдейты» в services.metrics
+        "jobs": {
+            name: {"count": h["n"], "avg_ms": h["seconds"] / h["n"] * 1000,
+                   "db_ms": h["db_seconds"] / h["n"] * 1000, "db_queries": h["db_queries"] / h["n"],
+                   "openai_ms": h["openai_seconds"] / h["n"] * 1000}
+            for name, h in sorted(db_by_handler.items()) if "_job:" in name and h["n"]
+        },
+        "api_calls": dict(session.calls),
+    }
+
+
+def print_report(r: dict):
+    print(f"users={r['users']} rounds={r['rounds']} api_latency={r['api_latency_ms']:.0f}ms")
+    print(f"updates: {r['updates']} за {r['wall_s']:.2f}s → {r['updates_per_s']:.1f}/s, "
+          f"p50 {r['update_p50_ms']:.2f}ms, p99 {r['update_p99_ms']:.2f}ms")
+    print(f"event loop lag: p99 {r['loop_lag_p99_ms']:.2f}ms, max {r['loop_lag_max_ms']:.2f}ms\n")
+    print(f"{'handler':<26}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'db ms':>9}{'queries':>9}")
+    for name, h in r["handlers"].items():
+        print(f"{name:<26}{h['count']:>7}{h['p50_ms']:>10.2f}{h['p95_ms']:>10.2f}{h['p99_ms']:>10.2f}{h['max_ms']:>10.2f}"
+              f"{h['db_ms']:>9.2f}{h['db_queries']:>9.1f}")
+    if r["jobs"]:
+        print(f"\n{'job':<26}{'count':>7}{'avg ms':>10}{'db ms':>9}{'queries':>9}{'openai ms':>11}")
+        for name, j in r["jobs"].items():
+            print(f"{name:<26}{j['count']:>7}{j['avg_ms']:>10.2f}{j['db_ms']:>9.2f}{j['db_queries']:>9.1f}{j['openai_ms']:>11.2f}")
+    print("\nBot API:", ", ".join(f"{k}={v}" for k, v in sorted(r["api_calls"].items())))
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--users", type=int, default=50, help="виртуальных пользователей (конкурентно)")
+    ap.add_argument("--rounds", type=int, default=3, help="тренировок на пользователя")
+    ap.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, мс")
+    ap.add_argument("--ai", action="store_true", help="AI-план через заглушку OpenAI (потоком) вместо локального")
+    ap.add_argument("--llm-latency", type=float, default=0.0, help="задержка между кусками ответа заглушки OpenAI, мс")
+    ap.add_argument("--json", type=Path, help="сохранить отчёт в JSON")
+    ap.add_argument("--verbose", action="store_true", help="не глушить stdout хендлеров")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure_env(args.users, os.path.join(tmp, "load.db"), ai=args.ai)
+        report = asyncio.run(run(args.users, args.rounds, args.api_latency / 1000, args.verbose,
+                                 ai=args.ai, llm_latency=args.llm_latency / 1000))
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
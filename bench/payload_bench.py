@@ -0,0 +1,109 @@
+"""
+Сравнение форматов payload для OpenAI (services/payload_codec.py): размер user-сообщения,
+токены и время упаковки на синтетических историях из planner_bench.
+
+    python bench/payload_bench.py                     # офлайн: символы, байты, токены, время упаковки
+    python bench/payload_bench.py --live 3            # + реальные вызовы API (нужен OPENAI_API_KEY):
+                                                      #   prompt_tokens из usage и латентность, медиана из 3
+
+Токены офлайн считаются tiktoken (o200k_base), если он установлен; иначе — оценка символы/3
+(помечена «≈»). Точная цифра — prompt_tokens в режиме --live.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.planner_bench import make_payload  # noqa: E402
+from services.openai_client import _build_messages  # noqa: E402
+from services.payload_codec import FORMATS  # noqa: E402
+
+SIZES = (10, 100, 500)
+MODES = ("strength", "yoga")
+
+
+def _token_counter():
+    try:
+        import tiktoken
+    except ImportError:
+        return (lambda s: len(s) // 3), True
+    enc = tiktoken.get_encoding("o200k_base")
+    return (lambda s: len(enc.encode(s))), False
+
+
+def offline(sizes, modes, iterations: int) -> list[dict]:
+    count, approx = _token_counter()
+    rows = []
+    for mode in modes:
+        for n in sizes:
+            payload = make_payload(mode, n)
+            for fmt in FORMATS:
+                content = _build_messages(payload, "", fmt)[1]["content"]
+                t0 = time.perf_counter()
+                for _ in range(iterations):
+                    _build_messages(payload, "", fmt)
+                rows.append({"mode": mode, "rows": n, "format": fmt, "chars": len(content),
+                             "bytes": len(content.encode()), "tokens": count(content), "approx": approx,
+                             "encode_ms": (time.perf_counter() - t0) / iterations * 1000})
+    return rows
+
+
+def live(rows: list[dict], repeat: int):
+    from config import OPENAI_MODEL
+    from services.openai_client import get_openai_client
+
+    client = get_openai_client()
+    if client is None:
+        sys.exit("--live: OPENAI_API_KEY не задан")
+    for r in rows:
+        messages = _build_messages(make_payload(r["mode"], r["rows"]), "", r["format"])
+        samples, usage = [], None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            resp = client.chat.completions.create(model=OPENAI_MODEL, messages=messages)
+            samples.append(time.perf_counter() - t0)
+            usage = resp.usage
+        r["prompt_tokens"] = usage.prompt_tokens if usage else None
+        r["completion_tokens"] = usage.completion_tokens if usage else None
+        r["latency_s"] = statistics.median(samples)
+
+
+def print_report(rows: list[dict]):
+    has_live = "latency_s" in rows[0]
+    head = f"{'mode':<10}{'rows':>6}  {'format':<9}{'chars':>8}{'bytes':>8}{'tokens':>9}{'vs json':>9}{'encode ms':>11}"
+    print(head + (f"{'prompt tok':>12}{'latency s':>11}" if has_live else ""))
+    base: dict[tuple, int] = {}
+    for r in rows:
+        key = (r["mode"], r["rows"])
+        if r["format"] == "json":
+            base[key] = r["tokens"]
+        ratio = r["tokens"] / base[key] if base.get(key) else 1.0
+        tok = f"{'≈' if r['approx'] else ''}{r['tokens']}"
+        line = (f"{r['mode']:<10}{r['rows']:>6}  {r['format']:<9}{r['chars']:>8}{r['bytes']:>8}{tok:>9}"
+                f"{ratio:>8.0%} {r['encode_ms']:>10.3f}")
+        if has_live:
+            line += f"{r['prompt_tokens'] or '-':>12}{r['latency_s']:>11.2f}"
+        print(line)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="строк истории")
+    ap.add_argument("--modes", nargs="+", default=list(MODES), choices=("strength", "yoga", "pilates"))
+    ap.add_argument("--iterations", type=int, default=50, help="повторов упаковки для encode ms")
+    ap.add_argument("--live", type=int, default=0, metavar="N", help="вызвать API N раз на формат и размер")
+    args = ap.parse_args(argv)
+
+    rows = offline(args.sizes, args.modes, args.iterations)
+    if args.live:
+        live(rows, args.live)
+    print_report(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+Бенчмарк планировщиков: local_planer.generate_plan и openai_client._resolve_prompt
+на синтетических историях от 10 до 10 000 записей в режимах strength/yoga/pilates.
+
+Payload собирается той же repository.build_planner_payload, что и в handlers/plan.py,
+поэтому форма {"пользователь", "история", "режим", "анкета"} совпадает с боевой.
+
+    python bench/planner_bench.py               # прогон и таблица
+    python bench/planner_bench.py --save        # записать базовую линию в bench/baseline.json
+    python bench/planner_bench.py --check       # сравнить с базовой линией, код 1 при регрессии
+    python bench/planner_bench.py --pool 4      # plans/s: inline против пула из 4 процессов (services.planner_pool)
+
+Метрики: plans/s, p50/p99 латентности одного вызова (лучший из --repeat прогонов), пиковый объём аллокаций за вызов
+и сколько из них осталось жить после него (tracemalloc, отдельным прогоном — на тайминги не влияет).
+"""
+import argparse
+import gc
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from services.exercise_catalog import CATALOG  # noqa: E402
+from services.local_planer import SEQS_YOGA, SEQS_PILATES, generate_plan  # noqa: E402
+from services.openai_client import _resolve_prompt  # noqa: E402
+from services.repository import build_planner_payload  # noqa: E402
+from utils.prompt_key import prompt_hash  # noqa: E402
+
+BASELINE = Path(__file__).with_name("baseline.json")
+SIZES = (10, 100, 1_000, 10_000)
+MODES = ("strength", "yoga", "pilates")
+TODAY = date(2025, 1, 31)
+SEED = 1729
+
+_STRENGTH_NAMES = [ex.name for ex in CATALOG] + ["Жим гантелей сидя", "Пуловер"]  # + пара названий вне каталога
+_MINDBODY_NAMES = {
+    "yoga": sorted({n for seq in SEQS_YOGA for n, _, _ in seq}),
+    "pilates": sorted({n for seq in SEQS_PILATES for n, _, _ in seq}),
+}
+
+
+def synthetic_user(mode: str) -> dict:
+    return {
+        "name": "Bench", "age": 30, "height": 180, "weight": 82, "goal": "сила", "experience": "2 года",
+        "training_type": mode, "prompt": None,
+        "bench_max_kg": 100, "cgbp_max_kg": 85, "squat_max_kg": 140, "pullups_reps": 12,
+        "deadlift_max_kg": 170, "dips_reps": 15, "ohp_max_kg": 60,
+    }
+
+
+def synthetic_history(mode: str, n: int, rng: random.Random) -> list[dict]:
+    """n строк в формате _SQL_HISTORY: тренировки по 4–6 упражнений × 3–4 подхода, по дню назад."""
+    names = _STRENGTH_NAMES if mode == "strength" else _MINDBODY_NAMES[mode]
+    rows: list[dict] = []
+    day = 0
+    while len(rows) < n:
+        day += 1
+        d = (TODAY - timedelta(days=day)).strftime("%Y-%m-%d")
+        for name in rng.sample(names, k=min(len(names), rng.randint(4, 6))):
+            for s in range(1, rng.randint(3, 4) + 1):
+                if mode == "strength":
+                    weight, target = rng.choice((20, 40, 60, 80, 100)), rng.choice((6, 8, 10, 12))
+                    actual = target + rng.randint(-2, 2)
+                else:
+                    weight, target = 0, rng.choice((30, 45, 60))
+                    actual = target + rng.randint(-8, 8)
+                rows.append({"date": d, "exercise": name, "set_number": s, "weight": weight,
+                             "target_reps": target, "actual_reps": actual if rng.random() > 0.1 else None})
+                if len(rows) >= n:
+                    return rows
+    return rows
+
+
+def make_payload(mode: str, n: int, seed: int = SEED) -> dict:
+    rng = random.Random(f"{seed}:{mode}:{n}")
+    return build_planner_payload(synthetic_user(mode), synthetic_history(mode, n, rng))
+
+
+def _traced(fn) -> tuple[int, int]:
+    """(осталось после вызова, пик) в байтах."""
+    tracemalloc.start()
+    try:
+        result = fn()
+        retained, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+    return retained, peak
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+
+# короче этого один замер не делаем: вызовы в единицы микросекунд меряются пачкой
+_MIN_SAMPLE_S = 20e-6
+
+
+def measure(fn, iterations: int, trace: bool = True) -> dict:
+    t0 = time.perf_counter()
+    fn()  # прогрев (lru_cache каталога, интернирование)
+    warm = time.perf_counter() - t0
+    batch = max(1, int(_MIN_SAMPLE_S / warm)) if warm else 1
+    gc.collect()
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        for _ in range(batch):
+            fn()
+        samples.append((time.perf_counter() - t0) / batch)
+    total = sum(samples)
+    retained = peak = 0
+    if trace:
+        retained, peak = _traced(fn)
+    return {
+        "iterations": iterations,
+        "per_sec": iterations / total if total else 0.0,
+        "p50_ms": statistics.median(samples) * 1000,
+        "p99_ms": _percentile(samples, 0.99) * 1000,
+        "peak_kb": peak / 1024,
+        "retained_kb": retained / 1024,
+    }
+
+
+def _calibration_work():
+    # эталонная нагрузка того же рода (dict/str/list), чтобы отделить изменения кода от скорости машины
+    d = {}
+    for i in range(2000):
+        k = f"упражнение {i % 97}"
+        d[k] = d.get(k, 0) + i
+    return sorted(d.items())
+
+
+def calibrate() -> float:
+    """p50 эталонной нагрузки, мс."""
+    return measure(_calibration_work, 50, trace=False)["p50_ms"]
+
+
+def cases():
+    """(имя, функция, итераций при полном прогоне) — payload'ы строятся один раз."""
+    for mode in MODES:
+        for n in SIZES:
+            payload = make_payload(mode, n)
+            yield f"generate_plan/{mode}/{n}", (lambda p=payload: generate_plan(p)), max(10, min(500, 50_000 // n))
+        payload = make_payload(mode, 100)
+        yield f"resolve_prompt/{mode}/default", (lambda p=payload: _resolve_prompt(p, None)), 2000
+        # как в handlers/plan.py: хеш промпта приходит готовым из users.prompt_hash (load_today_plan)
+        custom = "Составь тренировку на всё тело"
+        yield f"resolve_prompt/{mode}/custom", (lambda p=payload, h=prompt_hash(custom): _resolve_prompt(p, custom, h)), 2000
+        yield f"resolve_prompt/{mode}/custom_unhashed", (lambda p=payload: _resolve_prompt(p, custom)), 2000
+
+
+def run(quick: bool = False, repeat: int = 1) -> dict:
+    """
+    Каждый случай гоняется repeat раз, берётся прогон с лучшей медианой — так меньше шума.
+    rel — медиана в единицах эталонной нагрузки (calibrate): её и сравнивает --check,
+    чтобы базовая линия переносилась между машинами и не зависела от их загрузки.
+    """
+    results = {}
+    for key, fn, it in cases():
+        it = max(3, it // 10) if quick else it
+        runs = []
+        for _ in range(repeat):
+            # эталон меряем рядом с каждым прогоном: скорость виртуалки плавает даже внутри запуска
+            calib = calibrate()
+            r = measure(fn, it)
+            r["rel"] = r["p50_ms"] / ((calib + calibrate()) / 2)
+            runs.append(r)
+        results[key] = min(runs, key=lambda r: r["rel"])
+    return results
+
+
+def print_table(results: dict, baseline: dict | None = None):
+    head = f"{'case':<40}{'plans/s':>11}{'p50 ms':>10}{'p99 ms':>10}{'peak KB':>10}{'kept KB':>9}"
+    if baseline:
+        head += f"{'vs base':>9}"
+    print(head)
+    for key, r in results.items():
+        line = f"{key:<40}{r['per_sec']:>11.1f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['peak_kb']:>10.1f}{r['retained_kb']:>9.1f}"
+        if baseline and key in baseline:
+            line += f"{baseline[key]['rel'] / r['rel']:>8.2f}x"
+        print(line)
+
+
+def check(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Регрессии: нормированная медиана (rel) или пиковая память выросли больше чем на tolerance."""
+    problems = []
+    for key, base in baseline.items():
+        r = results.get(key)
+        if r is None:
+            continue
+        if r["rel"] > base["rel"] * (1 + tolerance):
+            problems.append(f"{key}: {r['rel']:.3f} > {base['rel']:.3f} эталонов (+{tolerance:.0%})")
+        if r["peak_kb"] > base["peak_kb"] * (1 + tolerance) + 16:
+            problems.append(f"{key}: peak {r['peak_kb']:.1f} KB > {base['peak_kb']:.1f} KB (+{tolerance:.0%})")
+    return problems
+
+
+def pool_throughput(size: int, plans: int = 200, history: int = 1_000) -> dict:
+    """
+    plans/s при plans одновременных запросах: generate_plan по очереди в одном процессе
+    против services.planner_pool (упаковка payload + пул из size процессов, прогретый заранее).
+    """
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    from services import planner_pool
+
+    payloads = [make_payload(MODES[i % len(MODES)], history, seed=i) for i in range(plans)]
+    t0 = time.perf_counter()
+    for p in payloads:
+        generate_plan(p)
+    inline = plans / (time.perf_counter() - t0)
+
+    async def pooled():
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(size, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=planner_pool._warm_worker) as pool:
+            await asyncio.gather(*(loop.run_in_executor(pool, planner_pool._ping) for _ in range(size)))
+            t0 = time.perf_counter()
+            await asyncio.gather(*(loop.run_in_executor(pool, planner_pool._plan_packed, planner_pool.pack_payload(p))
+                                   for p in payloads))
+            return plans / (time.perf_counter() - t0)
+    return {"inline": inline, f"process×{size}": asyncio.run(pooled())}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--quick", action="store_true", help="в 10 раз меньше итераций")
+    ap.add_argument("--repeat", type=int, default=5, help="прогонов на случай, берётся лучший (по умолчанию 5)")
+    ap.add_argument("--save", action="store_true", help=f"записать результаты в {BASELINE.name}")
+    ap.add_argument("--check", action="store_true", help="сравнить с базовой линией")
+    ap.add_argument("--tolerance", type=float, default=0.50, help="допустимое ухудшение (доля), по умолчанию 0.50")
+    ap.add_argument("--pool", type=int, default=0, help="сравнить inline с пулом из N процессов и выйти")
+    args = ap.parse_args(argv)
+
+    if args.pool:
+        for where, rate in pool_throughput(args.pool).items():
+            print(f"{where:<14}{rate:>10.1f} plans/s")
+        return 0
+    results = run(quick=args.quick, repeat=args.repeat)
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else None
+    print_table(results, baseline if args.check else None)
+
+    if args.save:
+        BASELINE.write_text(json.dumps(
+            {k: {m: float(f"{v:.4g}") if isinstance(v, float) else v for m, v in r.items()} for k, r in results.items()},
+            ensure_ascii=False, indent=2) + "\n")
+        print(f"\nБазовая линия записана в {BASELINE}")
+    if args.check:
+        if baseline is None:
+            print(f"\nНет {BASELINE.name}: сначала запусти с --save")
+            return 1
+        problems = check(results, baseline, args.tolerance)
+        print("\n" + ("\n".join(["Регрессии:"] + problems) if problems else "Регрессий нет"))
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
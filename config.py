@@ -6,4 +6,49 @@ DB_PATH = os.getenv("DB_URL", "trainer.db")
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5")  # как просил
-ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().isdigit()]
\ No newline at end of file
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))  # секунд на один запрос
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))  # одновременных запросов к OpenAI
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", str(max(2, OPENAI_MAX_CONCURRENCY * 2))))  # HTTP-соединений к OpenAI на процесс
+OPENAI_KEEPALIVE = float(os.getenv("OPENAI_KEEPALIVE", "120"))  # секунд держать простаивающее соединение открытым
+OPENAI_ATTEMPT_TIMEOUT = float(os.getenv("OPENAI_ATTEMPT_TIMEOUT", str(min(75.0, OPENAI_TIMEOUT))))  # секунд на одну попытку
+OPENAI_RETRIES = int(os.getenv("OPENAI_RETRIES", "2"))  # повторов при сетевых сбоях, 429 и 5xx (в пределах OPENAI_TIMEOUT)
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))  # секунд, задержка перед повтором: до base·2^n, с джиттером
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+OPENAI_CIRCUIT_FAILURES = int(os.getenv("OPENAI_CIRCUIT_FAILURES", "5"))  # сбоев подряд до размыкания цепи
+OPENAI_CIRCUIT_RESET = float(os.getenv("OPENAI_CIRCUIT_RESET", "60"))  # секунд до пробного вызова после размыкания
+OPENAI_CACHE_TTL = float(os.getenv("OPENAI_CACHE_TTL", str(6 * 3600)))  # секунд жизни ответа в кеше; 0 — без кеша
+# как упаковывать данные для OpenAI: json (прежний формат, по умолчанию), compact или table (меньше токенов;
+# качество планов на нём ещё не сверено), см. services/payload_codec.py и bench/payload_bench.py
+OPENAI_PAYLOAD_FORMAT = os.getenv("OPENAI_PAYLOAD_FORMAT", "json").strip().lower()
+# json_schema — structured outputs по схеме плана (короче и без эвристик разбора); text — формат описан в промпте
+OPENAI_RESPONSE_FORMAT = os.getenv("OPENAI_RESPONSE_FORMAT", "json_schema").strip().lower()
+OPENAI_STREAM = os.getenv("OPENAI_STREAM", "1").strip().lower() not in ("0", "false", "no", "")  # AI-план потоком, с правкой сообщения
+PLAN_WORKERS = int(os.getenv("PLAN_WORKERS", "4"))  # одновременно составляемых планов (фоновая очередь)
+PLAN_QUEUE_MAX = int(os.getenv("PLAN_QUEUE_MAX", "500"))  # задач в очереди планов; больше — «попробуй позже»
+# где считать локальный план: inline (в event loop'е) или process (пул процессов, см. services/planner_pool.py)
+PLANNER_EXECUTOR = os.getenv("PLANNER_EXECUTOR", "inline").strip().lower()
+PLANNER_POOL_SIZE = int(os.getenv("PLANNER_POOL_SIZE", str(min(4, os.cpu_count() or 1))))  # процессов в пуле планировщика
+PLAN_EDIT_INTERVAL = float(os.getenv("PLAN_EDIT_INTERVAL", "1.5"))  # секунд между правками сообщения при стриминге (лимиты Telegram)
+# режим получения апдейтов: polling (по умолчанию) или webhook (aiohttp-сервер)
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+BOT_API_URL = os.getenv("BOT_API_URL", "")  # свой Bot API сервер (или локальная заглушка для тестов); пусто — api.telegram.org
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")  # https://bot.example.com; пусто — setWebhook не вызываем
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # заголовок X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEB_WORKERS = max(1, int(os.getenv("WEB_WORKERS", "1")))  # процессов на одном порту (SO_REUSEPORT), общая SQLite/WAL
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG | INFO | WARNING | ERROR
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower()  # text | json
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "2000"))  # обрезка больших объектов в логе (payload, ответ LLM)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))  # доля больших DEBUG-записей, попадающих в лог
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")  # Prometheus-метрики в режиме webhook
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "60"))  # секунд между строками метрик в логе; 0 — выкл
+ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().isdigit()]
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").strip().lower()  # sqlite | memory
+FSM_TTL = float(os.getenv("FSM_TTL", str(7 * 24 * 3600)))  # секунд жизни незавершённого FSM-сценария
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))  # секунд жизни сессии плана/ожидаемого ввода
+# при нескольких воркерах кеш сессий в памяти по умолчанию выключен — источник правды только SQLite
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000" if WEB_WORKERS == 1 else "0"))  # сессий в памяти поверх SQLite
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))  # секунд жизни сессии в памяти
+SESSION_ABSENT_TTL = float(os.getenv("SESSION_ABSENT_TTL", "60"))  # секунд помнить в памяти, что сессии нет (без запроса в SQLite)
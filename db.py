@@ -1,5 +1,10 @@
+import asyncio
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from config import DB_PATH
+from services.metrics import track_db
+from utils.prompt_key import prompt_hash
 
 def get_connection():
     conn = sqlite3.connect(DB_PATH)
@@ -7,8 +12,109 @@ def get_connection():
     conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
+
+class Database:
+    """
+    Долгоживущее соединение SQLite, которое обслуживает один выделенный поток.
+    Все запросы из хендлеров уходят в этот поток через run()/fetchone()/..., поэтому
+    event loop не блокируется на I/O, а соединение (и кеш подготовленных выражений
+    sqlite3) переиспользуется между апдейтами.
+    Каждый вызов run() — одна транзакция: commit при успехе, rollback при исключении.
+    Время run() (вместе с ожиданием потока) и число SQL-запросов уходят в services.metrics.
+    """
+
+    def __init__(self, path: str = DB_PATH, cached_statements: int = 256):
+        self.path = path
+        self.cached_statements = cached_statements
+        self._conn: sqlite3.Connection | None = None
+        self._queries = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _trace(self, sql: str):
+        # считаем запросы, служебные BEGIN/COMMIT/ROLLBACK — нет
+        if not sql.startswith(("BEGIN", "COMMIT", "ROLLBACK")):
+            self._queries += 1
+
+    def _call(self, fn, args):
+        # выполняется только в потоке БД; (результат, ошибка, число запросов) — счётчик
+        # читаем здесь, в event loop'е он может уже обнуляться следующим вызовом
+        if self._conn is None:
+            self._conn = self._connect()
+        conn = self._conn
+        self._queries = 0
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result, None, self._queries
+        except Exception as e:
+            queries = self._queries
+            conn.rollback()
+            return None, e, queries
+
+    async def run(self, fn, *args):
+        """Выполнить fn(conn, *args) в потоке БД одной транзакцией."""
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        try:
+            result, error, queries = await loop.run_in_executor(self._executor, self._call, fn, args)
+        except Exception:
+            # упало подключение — запросов не было
+            track_db(time.perf_counter() - t0, 0)
+            raise
+        track_db(time.perf_counter() - t0, queries)
+        if error is not None:
+            raise error
+        return result
+
+    async def fetchone(self, sql: str, params: tuple = ()) -> sqlite3.Row | None:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> list[sqlite3.Row]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        """Выполнить модифицирующий запрос, вернуть rowcount."""
+        return await self.run(lambda conn: conn.execute(sql, params).rowcount)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=True)
+
+
+_db: Database | None = None
+
+def get_db() -> Database:
+    global _db
+    if _db is None:
+        _db = Database(DB_PATH)
+    return _db
+
+async def close_db():
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
+
 def init_db():
     conn = get_connection()
+    # WAL сохраняется в файле БД: читатели не блокируют писателя
+    conn.execute("PRAGMA journal_mode = WAL")
     # users
     conn.execute("""
     CREATE TABLE IF NOT EXISTS users(
@@ -43,6 +149,16 @@ def init_db():
         conn.execute("ALTER TABLE users ADD COLUMN training_type TEXT")
     except sqlite3.OperationalError:
         pass
+    # отпечаток промпта (utils/prompt_key.py); для старых строк досчитываем
+    try:
+        conn.execute("ALTER TABLE users ADD COLUMN prompt_hash TEXT")
+    except sqlite3.OperationalError:
+        pass
+    conn.executemany(
+        "UPDATE users SET prompt_hash = ? WHERE id = ?",
+        [(prompt_hash(r[1]), r[0]) for r in
+         conn.execute("SELECT id, prompt FROM users WHERE prompt IS NOT NULL AND prompt_hash IS NULL").fetchall()],
+    )
 
     # workouts
     conn.execute("""
@@ -84,7 +200,53 @@ def init_db():
         conn.execute("ALTER TABLE exercises ADD COLUMN date TEXT")
     except sqlite3.OperationalError:
         pass
+    # отпечаток входа планировщика (repository.plan_key) — кеш «плана на сегодня»
+    try:
+        conn.execute("ALTER TABLE workouts ADD COLUMN plan_key TEXT")
+    except sqlite3.OperationalError:
+        pass
     conn.execute("CREATE INDEX IF NOT EXISTS idx_workouts_tg_date ON workouts(tg_id, date)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_exercises_workout ON exercises(workout_id)")
+    # покрывающий индекс для истории планировщика: JOIN по workout_id, порядок по set_index,
+    # фильтр по training_type и все читаемые колонки берутся из индекса без обращения к таблице.
+    # Он же заменяет прежний idx_exercises_workout(workout_id) — тот стал его префиксом.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_exercises_history "
+        "ON exercises(workout_id, set_index, training_type, name, weight, target_reps, actual_reps)"
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_exercises_workout")
+
+    # FSM aiogram и сессии хендлеров (services/storage.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_storage(
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        expires_at REAL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sessions(
+        tg_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        data TEXT NOT NULL,
+        expires_at REAL,
+        PRIMARY KEY (tg_id, kind)
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires ON fsm_storage(expires_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+
+    # кеш ответов OpenAI (services/llm_cache.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS llm_cache(
+        key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        response TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at)")
     conn.commit()
     conn.close()
\ No newline at end of file
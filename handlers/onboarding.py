@@ -2,7 +2,7 @@ from aiogram import Router
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from states import OnboardFSM
-from db import get_connection
+from services.repository import update_user
 
 router = Router()
 
@@ -14,9 +14,7 @@ async def onboard_bench(message: Message, state: FSMContext):
     except:
         await message.answer("Пожалуйста, введи целое число. Жим лёжа — твой максимальный вес (кг)?")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET bench_max_kg = ? WHERE tg_id = ?", (val, tg_id))
-    conn.commit(); conn.close()
+    await update_user(tg_id, bench_max_kg=val)
     await state.set_state(OnboardFSM.cgbp)
     await message.answer("Жим узким хватом — максимальный вес (кг)? Введи целое число.")
 
@@ -30,9 +28,7 @@ async def onboard_cgbp(message: Message, state: FSMContext):
     except:
         await message.answer("Пожалуйста, введи целое число. Жим узким хватом — максимальный вес (кг)?")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET cgbp_max_kg = ? WHERE tg_id = ?", (val, tg_id))
-    conn.commit(); conn.close()
+    await update_user(tg_id, cgbp_max_kg=val)
     await state.set_state(OnboardFSM.squat)
     await message.answer("Присед со штангой на плечах — максимальный вес (кг)? Введи целое число.")
 
@@ -43,9 +39,7 @@ async def onboard_squat(message: Message, state: FSMContext):
     except:
         await message.answer("Пожалуйста, введи целое число. Присед со штангой на плечах — максимальный вес (кг)?")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET squat_max_kg = ? WHERE tg_id = ?", (val, tg_id))
-    conn.commit(); conn.close()
+    await update_user(tg_id, squat_max_kg=val)
     await state.set_state(OnboardFSM.pullups)
     await message.answer("Сколько раз подтягиваешься (чистые повторения)? Введи целое число.")
 
@@ -56,9 +50,7 @@ async def onboard_pullups(message: Message, state: FSMContext):
     except:
         await message.answer("Пожалуйста, введи целое число. Сколько раз подтягиваешься (чистые повторения)?")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET pullups_reps = ? WHERE tg_id = ?", (val, tg_id))
-    conn.commit(); conn.close()
+    await update_user(tg_id, pullups_reps=val)
     await state.set_state(OnboardFSM.deadlift)
     await message.answer("Становая тяга — максимальный вес (кг)? Введи целое число.")
 
@@ -69,9 +61,7 @@ async def onboard_deadlift(message: Message, state: FSMContext):
     except:
         await message.answer("Пожалуйста, введи целое число. Становая тяга — максимальный вес (кг)?")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET deadlift_max_kg = ? WHERE tg_id = ?", (val, tg_id))
-    conn.commit(); conn.close()
+    await update_user(tg_id, deadlift_max_kg=val)
     await state.set_state(OnboardFSM.ohp)
     await message.answer("Подъём штанги стоя (армейский жим) — максимальный вес (кг)? Введи целое число.")
 
@@ -82,9 +72,7 @@ async def onboard_ohp(message: Message, state: FSMContext):
     except:
         await message.answer("Пожалуйста, введи целое число. Подъём штанги стоя (армейский жим) — максимальный вес (кг)?")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET ohp_max_kg = ? WHERE tg_id = ?", (val, tg_id))
-    conn.commit(); conn.close()
+    await update_user(tg_id, ohp_max_kg=val)
     await state.set_state(OnboardFSM.dips)
     await message.answer("Отжимания на брусьях — сколько повторений? Введи целое число.")
 
@@ -95,9 +83,7 @@ async def onboard_dips(message: Message, state: FSMContext):
     except:
         await message.answer("Пожалуйста, введи целое число. Отжимания на брусьях — сколько повторений?")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET dips_reps = ? WHERE tg_id = ?", (val, tg_id))
-    conn.commit(); conn.close()
+    await update_user(tg_id, dips_reps=val)
     await state.clear()
     from keyboards import main_kb
     await message.answer("Спасибо! Данные сохранены. Выбирай действие ниже.", reply_markup=main_kb)
\ No newline at end of file
@@ -1,48 +1,67 @@
-import re, json
-from datetime import datetime, timedelta, timezone
+import re, json, asyncio, time, logging
+from datetime import datetime, timezone
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 
-from db import get_connection
+from services.repository import (
+    list_recent_workouts, get_workout,
+    get_workout_sets, save_plan, get_today_names, get_exercise_sets,
+    save_actual_reps, delete_workout, load_today_plan, start_plan, add_plan_items, plan_names,
+)
+from services.job_queue import JobQueue
+from services.storage import SessionStore
 from keyboards import main_kb
 from utils.formatting import exercise_status_icon
-from services.local_planer import generate_plan
-from services.openai_client import ask_openai
-from config import OPENAI_API_KEY
+from utils.prompt_key import prompt_hash
+from services.planner_pool import plan_async
+from services.openai_client import ask_openai_async, ask_openai_stream, UPSTREAM_ERRORS
+from config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_STREAM, PLAN_EDIT_INTERVAL, PLAN_WORKERS, PLAN_QUEUE_MAX
 # если хочешь промпт из файла/переменной — импортни здесь как дефолт
 try:
     from prompt import PROMPT as DEFAULT_PROMPT
 except Exception:
     DEFAULT_PROMPT = ""
+DEFAULT_PROMPT_HASH = prompt_hash(DEFAULT_PROMPT)
 
 router = Router()
+logger = logging.getLogger(__name__)
 
-# кеши на сессию процесса
-EX_CACHE = {}   # {tg_id: {"date": str, "names": [str], "workout_id": int|None}}
-EXPECT_INPUT = {}  # {tg_id: {"workout_id": int|None, "name": str, "set_indices": [int], "date": str}}
+# сессии пользователей (в SQLite, с TTL — переживают рестарт; горячие — в LRU-кеше в памяти)
+EX_CACHE = SessionStore("plan")   # {"date": str, "names": [str], "workout_id": int|None}
+EXPECT_INPUT = SessionStore("expect_input")  # {"workout_id": int|None, "name": str, "set_indices": [int], "date": str}
+# генерация планов — в фоне, не больше PLAN_WORKERS одновременно (остановка — в main.create_dispatcher)
+PLAN_JOBS = JobQueue("plan", workers=PLAN_WORKERS, maxsize=PLAN_QUEUE_MAX)
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().strftime("%Y-%m-%d")
+
+
+async def _plan_session(tg_id: int) -> dict | None:
+    """Сессия открытого плана; если её нет (истекла/вытеснена) — восстанавливаем сегодняшний план из БД."""
+    cache = await EX_CACHE.get(tg_id)
+    if cache and cache.get("names"):
+        return cache
+    today = _today()
+    names = await get_today_names(tg_id, today)
+    if not names:
+        return None
+    cache = {"date": today, "names": names, "workout_id": None}
+    await EX_CACHE.set(tg_id, cache)
+    return cache
 
 @router.message(F.text == "Показать тренировки")
 async def list_workouts(message: Message):
     tg_id = message.from_user.id
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("""
-        SELECT id, date FROM workouts
-        WHERE tg_id = ?
-        ORDER BY date DESC, id DESC
-        LIMIT 10
-    """, (tg_id,))
-    rows = cur.fetchall()
+    rows = await list_recent_workouts(tg_id, limit=10)
     if not rows:
-        conn.close()
         await message.answer("У тебя ещё нет сохранённых тренировок.")
         return
     buttons = []
     for r in rows:
-        wid, wdate = r["id"], r["date"]
-        cnt = conn.execute("SELECT COUNT(DISTINCT name) AS c FROM exercises WHERE workout_id = ?", (wid,)).fetchone()["c"]
+        wid, wdate, cnt = r["id"], r["date"], r["cnt"]
         buttons.append([InlineKeyboardButton(text=f"{wdate} — {cnt} упр.", callback_data=f"workouts:open:{wid}")])
-    conn.close()
     await message.answer("Последние тренировки:", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
 
 @router.callback_query(F.data.startswith("workouts:open:"))
@@ -54,31 +73,19 @@ async def workouts_open(callback: CallbackQuery):
         await callback.answer("Ошибка id тренировки", show_alert=False)
         return
 
-    conn = get_connection(); cur = conn.cursor()
-    wrow = cur.execute("SELECT id, date FROM workouts WHERE id = ? AND tg_id = ?", (wid, tg_id)).fetchone()
+    wrow, sets_by_name = await get_workout_sets(tg_id, wid)
     if not wrow:
-        conn.close()
         await callback.answer("Нет доступа к этой тренировке", show_alert=False)
         return
 
-    cur.execute("SELECT DISTINCT e.name FROM exercises e WHERE e.workout_id = ? ORDER BY e.name COLLATE NOCASE", (wid,))
-    names = [row[0] for row in cur.fetchall()]
-
+    names = list(sets_by_name.keys())
     rows_btn = []
     for i, name in enumerate(names, start=1):
-        cur.execute("""
-            SELECT e.set_index, e.target_reps, e.actual_reps
-            FROM exercises e JOIN workouts w ON w.id = e.workout_id
-            WHERE e.workout_id = ? AND w.tg_id = ? AND e.name = ?
-            ORDER BY e.set_index ASC
-        """, (wid, tg_id, name))
-        rset = cur.fetchall()
-        icon = exercise_status_icon(rset)
+        icon = exercise_status_icon(sets_by_name[name])
         label = f"{icon} {name}" if icon else name
         rows_btn.append([InlineKeyboardButton(text=label, callback_data=f"plan:ex:{i}")])
-    conn.close()
 
-    EX_CACHE[tg_id] = {"date": wrow["date"], "names": names, "workout_id": wid}
+    await EX_CACHE.set(tg_id, {"date": wrow["date"], "names": names, "workout_id": wid})
     rows_btn.append([InlineKeyboardButton(text="🗑 Удалить тренировку", callback_data=f"plan:del:{wid}")])
     kb = InlineKeyboardMarkup(inline_keyboard=rows_btn)
     try:
@@ -87,65 +94,43 @@ async def workouts_open(callback: CallbackQuery):
         await callback.message.answer(f"Тренировка за {wrow['date']}:", reply_markup=kb)
     await callback.answer()
 
-@router.message(F.text == "Новая тренировка")
-async def new_training_local(message: Message):
-    tg_id = message.from_user.id
-    conn = get_connection(); cur = conn.cursor()
-    user = cur.execute("SELECT * FROM users WHERE tg_id = ?", (tg_id,)).fetchone()
-    user_dict = dict(user) if user else {}
-    # Try multiple possible column names for mode
-    mode_val = user_dict.get("training_type") or user_dict.get("mode") or user_dict.get("training_mode")
-    user_info = user_dict
-    user_info_ru = {"Имя": user_info.get("name"), "Возраст": user_info.get("age"), "Рост": user_info.get("height"),
-                    "Вес": user_info.get("weight"), "Цель": user_info.get("goal"), "Опыт": user_info.get("experience"),
-                    "Режим": mode_val}
-    since = (datetime.now(timezone.utc).date() - timedelta(days=30)).strftime("%Y-%m-%d")
-    if mode_val:
-        cur.execute(
-            """
-            SELECT w.date AS date, e.name AS exercise, e.set_index AS set_number,
-                   e.weight AS weight, e.target_reps AS target_reps, e.actual_reps AS actual_reps
-            FROM workouts w JOIN exercises e ON e.workout_id = w.id
-            WHERE w.tg_id = ? AND w.date >= ? AND e.training_type = ?
-            ORDER BY w.date ASC, w.id ASC, e.set_index ASC
-            """,
-            (tg_id, since, mode_val),
-        )
-    else:
-        cur.execute(
-            """
-            SELECT w.date AS date, e.name AS exercise, e.set_index AS set_number,
-                   e.weight AS weight, e.target_reps AS target_reps, e.actual_reps AS actual_reps
-            FROM workouts w JOIN exercises e ON e.workout_id = w.id
-            WHERE w.tg_id = ? AND w.date >= ?
-            ORDER BY w.date ASC, w.id ASC, e.set_index ASC
-            """,
-            (tg_id, since),
-        )
-    history_rows = [dict(r) for r in cur.fetchall()]
-    history_ru = [{"дата": r["date"], "упражнение": r["exercise"], "подход": r["set_number"],
-                   "вес": r["weight"], "целевые_повторения": r["target_reps"], "выполненные_повторения": r["actual_reps"]}
-                  for r in history_rows]
-    print(history_ru)
-    payload = {"пользователь": user_info_ru, "история": history_ru, "режим": mode_val}
-    ob = cur.execute(
-        "SELECT bench_max_kg, cgbp_max_kg, squat_max_kg, pullups_reps, deadlift_max_kg, dips_reps, ohp_max_kg FROM users WHERE tg_id = ?",
-        (tg_id,)
-    ).fetchone()
-    payload["анкета"] = {
-        "жим_лёжа_макс_кг": ob["bench_max_kg"] if ob else None,
-        "узкий_жим_лёжа_макс_кг": ob["cgbp_max_kg"] if ob else None,
-        "присед_макс_кг": ob["squat_max_kg"] if ob else None,
-        "подтягивания_повторы": ob["pullups_reps"] if ob else None,
-        "становая_макс_кг": ob["deadlift_max_kg"] if ob else None,
-        "брусья_повторы": ob["dips_reps"] if ob else None,
-        "ohp_max_kg": ob["ohp_max_kg"] if ob else None,
-    }
-    conn.close()
-
-    print(f"[DEBUG] Resolved training mode: {mode_val!r}")
+def _plan_keyboard(names: list[str], workout_id: int | None, sets_by_name: dict | None = None,
+                   regen: str | None = None) -> InlineKeyboardMarkup:
+    rows = []
+    for i, name in enumerate(names, start=1):
+        icon = exercise_status_icon(sets_by_name.get(name, [])) if sets_by_name else ""
+        rows.append([InlineKeyboardButton(text=f"{icon} {name}" if icon else name, callback_data=f"plan:ex:{i}")])
+    if regen:
+        rows.append([InlineKeyboardButton(text="🔄 Пересоздать план", callback_data=f"plan:regen:{regen}")])
+    if workout_id:
+        rows.append([InlineKeyboardButton(text="🗑 Удалить тренировку", callback_data=f"plan:del:{workout_id}")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def _show_existing_plan(message: Message, tg_id: int, workout_id: int, source: str) -> bool:
+    """План на сегодня с тем же входом уже есть — показываем его вместо новой генерации."""
+    wrow, sets_by_name = await get_workout_sets(tg_id, workout_id)
+    if not wrow or not sets_by_name:
+        return False
+    names = list(sets_by_name)
+    await EX_CACHE.set(tg_id, {"date": wrow["date"], "names": names, "workout_id": workout_id})
+    await message.answer("План на сегодня уже составлен — с тех пор ничего не изменилось.\n"
+                         "Нужен другой — нажми «Пересоздать план».",
+                         reply_markup=_plan_keyboard(names, workout_id, sets_by_name, regen=source))
+    return True
+
+
+async def _local_plan(message: Message, tg_id: int, force: bool = False, fallback: bool = False):
+    """fallback — вместо AI-плана, когда OpenAI недоступен: кнопка «Пересоздать» снова пробует AI."""
+    today_iso = _today()
+    plan = await load_today_plan(tg_id, today_iso, "local", force=force)
+    if plan.workout_id and await _show_existing_plan(message, tg_id, plan.workout_id, "local"):
+        return
+    if plan.payload is None:
+        plan = await load_today_plan(tg_id, today_iso, "local", force=True)
+    payload, mode_val = plan.payload, plan.payload["режим"]
     try:
-        plan_items = generate_plan(payload)
+        plan_items = await plan_async(payload)
     except Exception as e:
         await message.answer(f"Локальный планировщик упал: {e}")
         return
@@ -154,151 +139,216 @@ async def new_training_local(message: Message):
         await message.answer("Локальный планировщик вернул пустой список.")
         return
 
-    today_iso = datetime.now(timezone.utc).date().strftime("%Y-%m-%d")
-    conn2 = get_connection(); cur2 = conn2.cursor()
-    cur2.execute("INSERT INTO workouts (tg_id, date, notes) VALUES (?, ?, ?)", (tg_id, today_iso, "auto from local_planer"))
-    workout_id = cur2.lastrowid
-
-    inserted = 0
-    for item in plan_items:
-        try:
-            name = item.get("Название упражнения"); si = int(item.get("Номер подхода"))
-            weight = item.get("Вес"); weight = int(weight) if weight is not None else None
-            target = item.get("Количество повторений"); target = int(target) if target is not None else None
-            if not name or si is None: continue
-            cur2.execute(
-                """
-                INSERT INTO exercises(workout_id,name,set_index,weight,target_reps,actual_reps,date,training_type)
-                VALUES(?,?,?,?,?,NULL,?,?)
-                """,
-                (workout_id, name, si, weight, target, today_iso, mode_val),
-            )
-            inserted += 1
-        except Exception as ex:
-            print(f"[DB] Skip row: {ex} | {item}")
-    conn2.commit(); conn2.close()
+    workout_id, names = await save_plan(tg_id, today_iso, mode_val, plan_items, notes="auto from local_planer",
+                                        plan_key=plan.plan_key, replace=force)
 
     # UI
-    conn3 = get_connection(); cur3 = conn3.cursor()
-    cur3.execute("SELECT DISTINCT name FROM exercises WHERE workout_id = ? ORDER BY name COLLATE NOCASE", (workout_id,))
-    names = [r[0] for r in cur3.fetchall()]; conn3.close()
-
     if not names:
-        await message.answer("План сохранён, но упражнений не найдено.")
+        await message.answer("Локальный план не содержит ни одного корректного подхода.")
         return
 
-    EX_CACHE[tg_id] = {"date": today_iso, "names": names, "workout_id": workout_id}
-    rows = [[InlineKeyboardButton(text=n, callback_data=f"plan:ex:{i}") ] for i, n in enumerate(names, start=1)]
-    rows.append([InlineKeyboardButton(text="🗑 Удалить тренировку", callback_data=f"plan:del:{workout_id}")])
-    await message.answer("Упражнения на сегодня (локальный план):",
-                         reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
+    await EX_CACHE.set(tg_id, {"date": today_iso, "names": names, "workout_id": workout_id})
+    title = ("OpenAI сейчас недоступен — вот локальный план на сегодня:" if fallback else
+             "Упражнения на сегодня (локальный план):")
+    await message.answer(title, reply_markup=_plan_keyboard(names, workout_id, regen="ai" if fallback else "local"))
 
-@router.message(F.text == "Новая AI тренировка")
-async def new_training_ai(message: Message):
-    tg_id = message.from_user.id
-    conn = get_connection(); cur = conn.cursor()
-    user = cur.execute("SELECT * FROM users WHERE tg_id = ?", (tg_id,)).fetchone()
-    user_dict = dict(user) if user else {}
-    mode_val = user_dict.get("training_type") or user_dict.get("mode") or user_dict.get("training_mode")
-    user_info = user_dict
-    user_info_ru = {"Имя": user_info.get("name"), "Возраст": user_info.get("age"), "Рост": user_info.get("height"),
-                    "Вес": user_info.get("weight"), "Цель": user_info.get("goal"), "Опыт": user_info.get("experience"),
-                    "Режим": mode_val}
-    since = (datetime.now(timezone.utc).date() - timedelta(days=30)).strftime("%Y-%m-%d")
-    if mode_val:
-        cur.execute(
-            """
-            SELECT w.date AS date, e.name AS exercise, e.set_index AS set_number,
-                   e.weight AS weight, e.target_reps AS target_reps, e.actual_reps AS actual_reps
-            FROM workouts w JOIN exercises e ON e.workout_id = w.id
-            WHERE w.tg_id = ? AND w.date >= ? AND e.training_type = ?
-            ORDER BY w.date ASC, w.id ASC, e.set_index ASC
-            """,
-            (tg_id, since, mode_val),
-        )
-    else:
-        cur.execute(
-            """
-            SELECT w.date AS date, e.name AS exercise, e.set_index AS set_number,
-                   e.weight AS weight, e.target_reps AS target_reps, e.actual_reps AS actual_reps
-            FROM workouts w JOIN exercises e ON e.workout_id = w.id
-            WHERE w.tg_id = ? AND w.date >= ?
-            ORDER BY w.date ASC, w.id ASC, e.set_index ASC
-            """,
-            (tg_id, since),
-        )
-    history_rows = [dict(r) for r in cur.fetchall()]
-    history_ru = [{"дата": r["date"], "упражнение": r["exercise"], "подход": r["set_number"],
-                   "вес": r["weight"], "целевые_повторения": r["target_reps"], "выполненные_повторения": r["actual_reps"]}
-                  for r in history_rows]
-    payload = {"пользователь": user_info_ru, "история": history_ru, "режим": mode_val}
-    ob = cur.execute(
-        "SELECT bench_max_kg, cgbp_max_kg, squat_max_kg, pullups_reps, deadlift_max_kg, dips_reps, ohp_max_kg FROM users WHERE tg_id = ?",
-        (tg_id,)
-    ).fetchone()
-    payload["анкета"] = {
-        "жим_лёжа_макс_кг": ob["bench_max_kg"] if ob else None,
-        "узкий_жим_лёжа_макс_кг": ob["cgbp_max_kg"] if ob else None,
-        "присед_макс_кг": ob["squat_max_kg"] if ob else None,
-        "подтягивания_повторы": ob["pullups_reps"] if ob else None,
-        "становая_макс_кг": ob["deadlift_max_kg"] if ob else None,
-        "брусья_повторы": ob["dips_reps"] if ob else None,
-        "ohp_max_kg": ob["ohp_max_kg"] if ob else None,
-    }
-    conn.close()
-
-    # Получить пользовательский prompt из профиля; если пусто — взять дефолт из prompt.py
-    conn_p = get_connection(); cur_p = conn_p.cursor()
-    row_p = cur_p.execute("SELECT prompt FROM users WHERE tg_id = ?", (tg_id,)).fetchone()
-    conn_p.close()
-    user_prompt = (row_p["prompt"] if row_p else None)
-    prompt_text = (user_prompt or "").strip() or DEFAULT_PROMPT
 
+async def _ai_plan(message: Message, tg_id: int, force: bool = False):
     if not OPENAI_API_KEY:
         await message.answer("Ошибка OpenAI: проверь ключ в .env (для AI-плана)")
         return
 
-    print(f"[DEBUG] Resolved training mode: {mode_val!r}")
-    raw, items = ask_openai(payload, prompt_text)
-    print("[OpenAI] RAW:\n", raw)
+    today_iso = _today()
+    # модель входит в ключ: смена OPENAI_MODEL — уже другой план
+    plan = await load_today_plan(tg_id, today_iso, "ai", salt=OPENAI_MODEL, force=force)
+    if plan.workout_id and await _show_existing_plan(message, tg_id, plan.workout_id, "ai"):
+        return
+    if plan.payload is None:
+        plan = await load_today_plan(tg_id, today_iso, "ai", salt=OPENAI_MODEL, force=True)
+    payload, mode_val = plan.payload, plan.payload["режим"]
+
+    # пользовательский prompt из профиля; если пусто — взять дефолт из prompt.py
+    prompt_text = (plan.user_prompt or "").strip() or DEFAULT_PROMPT
+    # готовый отпечаток из users.prompt_hash (для дефолта посчитан при импорте)
+    phash = plan.prompt_hash if (plan.user_prompt or "").strip() else DEFAULT_PROMPT_HASH
+
+    if OPENAI_STREAM:
+        await _ai_plan_stream(message, tg_id, today_iso, plan, prompt_text, phash, force)
+        return
+
+    try:
+        raw, items = await ask_openai_async(payload, prompt_text, refresh=force, prompt_hash=phash)
+    except UPSTREAM_ERRORS as e:
+        logger.warning("AI-план для %s: OpenAI недоступен (%s) — отдаю локальный", tg_id, type(e).__name__)
+        await _local_plan(message, tg_id, force=force, fallback=True)
+        return
 
     if not items:
         await message.answer("План от OpenAI не разобрался. См. логи.")
         return
 
-    today_iso = datetime.now(timezone.utc).date().strftime("%Y-%m-%d")
-    conn2 = get_connection(); cur2 = conn2.cursor()
-    cur2.execute("INSERT INTO workouts (tg_id, date, notes) VALUES (?, ?, ?)", (tg_id, today_iso, "auto from OpenAI"))
-    workout_id = cur2.lastrowid
+    workout_id, names = await save_plan(tg_id, today_iso, mode_val, items, notes="auto from OpenAI",
+                                        plan_key=plan.plan_key, replace=force)
+    if not names:
+        await message.answer("План от OpenAI не содержит ни одного корректного подхода. См. логи.")
+        return
 
-    inserted = 0
-    for it in items:
+    await EX_CACHE.set(tg_id, {"date": today_iso, "names": names, "workout_id": workout_id})
+    await message.answer("Упражнения на сегодня:", reply_markup=_plan_keyboard(names, workout_id, regen="ai"))
+
+
+class _StreamedPlan:
+    """
+    AI-план потоком: сообщение-заготовка, которое правится по мере прихода упражнений
+    (не чаще PLAN_EDIT_INTERVAL — у Telegram лимит на правки), и подходы, сохраняемые
+    в БД сразу после разбора.
+    """
+
+    def __init__(self, message: Message, tg_id: int, date: str, mode: str | None, plan_key: str, force: bool):
+        self.message, self.tg_id, self.date, self.mode = message, tg_id, date, mode
+        self.plan_key, self.force = plan_key, force
+        self.placeholder: Message | None = None
+        self.workout_id: int | None = None
+        self.existed = False            # план с тем же ключом уже сохранил параллельный запрос
+        self.rows: list[tuple] = []
+        self.sets: dict[str, int] = {}  # упражнение -> подходов, в порядке прихода
+        self._edited_at = 0.0
+        self._shown = 0
+
+    async def begin(self):
+        self.placeholder = await self.message.answer("Составляю план…")
+        self._edited_at = time.monotonic()
+
+    async def add(self, item: dict):
+        if self.workout_id is None:
+            self.workout_id, self.existed = await start_plan(self.tg_id, self.date, notes="auto from OpenAI",
+                                                             plan_key=self.plan_key, replace=self.force)
+        if self.existed:
+            return
+        rows = await add_plan_items(self.workout_id, self.date, self.mode, [item])
+        for r in rows:
+            self.sets[r[0]] = self.sets.get(r[0], 0) + 1
+        self.rows += rows
+        if len(self.sets) > self._shown and time.monotonic() - self._edited_at >= PLAN_EDIT_INTERVAL:
+            self._shown = len(self.sets)
+            await self.edit("Составляю план…\n\n" + "\n".join(f"• {n} — {c} подх." for n, c in self.sets.items()))
+
+    async def edit(self, text: str, reply_markup: InlineKeyboardMarkup | None = None):
+        self._edited_at = time.monotonic()
         try:
-            name = it.get("Название упражнения")
-            si = int(it.get("Номер подхода"))
-            weight = it.get("Вес"); weight = int(weight) if weight is not None else None
-            target = it.get("Количество повторений"); target = int(target) if target is not None else None
-            if not name or si is None: continue
-            cur2.execute(
-                """
-                INSERT INTO exercises(workout_id,name,set_index,weight,target_reps,actual_reps,date,training_type)
-                VALUES(?,?,?,?,?,NULL,?,?)
-                """,
-                (workout_id, name, si, weight, target, today_iso, mode_val),
-            )
-            inserted += 1
-        except Exception as ex:
-            print(f"[DB] Skip row: {ex} | {it}")
-    conn2.commit(); conn2.close()
-
-    conn3 = get_connection(); cur3 = conn3.cursor()
-    cur3.execute("SELECT DISTINCT name FROM exercises WHERE workout_id = ? ORDER BY name COLLATE NOCASE", (workout_id,))
-    names = [r[0] for r in cur3.fetchall()]; conn3.close()
-
-    EX_CACHE[tg_id] = {"date": today_iso, "names": names, "workout_id": workout_id}
-    rows = [[InlineKeyboardButton(text=n, callback_data=f"plan:ex:{i}") ] for i, n in enumerate(names, start=1)]
-    rows.append([InlineKeyboardButton(text="🗑 Удалить тренировку", callback_data=f"plan:del:{workout_id}")])
-    await message.answer("Упражнения на сегодня:", reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
+            await self.placeholder.edit_text(text, reply_markup=reply_markup)
+        except Exception:
+            # «message is not modified» и т.п. — не повод ронять генерацию
+            pass
+
+    async def drop(self):
+        try:
+            await self.placeholder.delete()
+        except Exception:
+            pass
+
+    async def discard(self):
+        """Убрать недостроенный план (ошибка/пустой ответ); чужой — не трогаем."""
+        if self.workout_id and not self.existed:
+            await delete_workout(self.tg_id, self.workout_id)
+            self.workout_id = None
+
+
+async def _ai_plan_stream(message: Message, tg_id: int, today_iso: str, plan, prompt_text: str,
+                          phash: str | None, force: bool):
+    progress = _StreamedPlan(message, tg_id, today_iso, plan.payload["режим"], plan.plan_key, force)
+    await progress.begin()
+    try:
+        await ask_openai_stream(plan.payload, prompt_text, progress.add, refresh=force, prompt_hash=phash)
+    except UPSTREAM_ERRORS as e:
+        logger.warning("AI-план для %s: OpenAI недоступен (%s) — отдаю локальный", tg_id, type(e).__name__)
+        await progress.discard()
+        await progress.drop()
+        await _local_plan(message, tg_id, force=force, fallback=True)
+        return
+    except BaseException:
+        await asyncio.shield(progress.discard())
+        raise
+
+    if progress.existed:
+        await progress.drop()
+        await _show_existing_plan(message, tg_id, progress.workout_id, "ai")
+        return
+    if not progress.rows:
+        await progress.discard()
+        await progress.edit("План от OpenAI не разобрался. См. логи.")
+        return
+
+    names = plan_names(progress.rows)
+    await EX_CACHE.set(tg_id, {"date": today_iso, "names": names, "workout_id": progress.workout_id})
+    await progress.edit("Упражнения на сегодня:", reply_markup=_plan_keyboard(names, progress.workout_id, regen="ai"))
+
+
+class _Reply:
+    """
+    Ответ фоновой задачи плана: первый answer() превращает заготовку «План готовится…»
+    в нужный текст, следующие — обычные сообщения. Подставляется вместо Message в _local_plan/_ai_plan.
+    """
+
+    def __init__(self, message: Message, placeholder: Message):
+        self.message, self.placeholder = message, placeholder
+        self._used = False
+
+    async def answer(self, text: str, **kwargs) -> Message:
+        if not self._used:
+            self._used = True
+            try:
+                await self.placeholder.edit_text(text, **kwargs)
+                return self.placeholder
+            except Exception:
+                pass
+        return await self.message.answer(text, **kwargs)
+
+
+# меньше — раньше: локальный план быстрый, за AI-планами его не держим
+_PRIORITY = {"local": 0, "ai": 1}
+
+
+async def _enqueue_plan(message: Message, tg_id: int, source: str, force: bool = False):
+    """Поставить генерацию плана в PLAN_JOBS: одна на пользователя, ответ — правкой заготовки."""
+    if PLAN_JOBS.is_duplicate(tg_id):
+        await message.answer("План уже готовится — пришлю, как только будет готов.")
+        return
+    placeholder = await message.answer("План готовится…")
+    reply = _Reply(message, placeholder)
+    build = _ai_plan if source == "ai" else _local_plan
+
+    async def job():
+        try:
+            await build(reply, tg_id, force=force)
+        except Exception:
+            logger.exception("План (%s) для %s не составлен", source, tg_id)
+            await reply.answer("Не получилось составить план. Попробуй ещё раз.")
+
+    try:
+        queued = PLAN_JOBS.submit(tg_id, _PRIORITY.get(source, 1), job, name=source)
+    except asyncio.QueueFull:
+        await placeholder.edit_text("Сейчас слишком много запросов. Попробуй через минуту.")
+        return
+    if not queued:
+        # пока отправляли заготовку, успела встать другая задача этого пользователя
+        await placeholder.edit_text("План уже готовится — пришлю, как только будет готов.")
+
+
+@router.message(F.text == "Новая тренировка")
+async def new_training_local(message: Message):
+    await _enqueue_plan(message, message.from_user.id, "local")
+
+@router.message(F.text == "Новая AI тренировка")
+async def new_training_ai(message: Message):
+    await _enqueue_plan(message, message.from_user.id, "ai")
+
+@router.callback_query(F.data.startswith("plan:regen:"))
+async def plan_regenerate(callback: CallbackQuery):
+    """Явная перегенерация плана на сегодня (кеш плана пропускается)."""
+    source = callback.data.split(":")[-1]
+    await callback.answer("Составляю новый план…")
+    await _enqueue_plan(callback.message, callback.from_user.id, "ai" if source == "ai" else "local", force=True)
 
 @router.callback_query(F.data.startswith("plan:ex:"))
 async def plan_open_exercise(callback: CallbackQuery):
@@ -307,8 +357,8 @@ async def plan_open_exercise(callback: CallbackQuery):
     except:
         await callback.answer("Ошибка индекса", show_alert=False); return
 
-    cache = EX_CACHE.get(tg_id)
-    if not cache or not cache.get("names"):
+    cache = await _plan_session(tg_id)
+    if not cache:
         await callback.message.answer("План не найден. Сформируй новую тренировку.")
         await callback.answer(); return
 
@@ -318,28 +368,13 @@ async def plan_open_exercise(callback: CallbackQuery):
 
     name = names[idx-1]
     workout_id = cache.get("workout_id")
-    conn = get_connection(); cur = conn.cursor()
-    if workout_id:
-        cur.execute("""
-            SELECT e.set_index, e.weight, e.target_reps, e.actual_reps
-            FROM exercises e JOIN workouts w ON w.id = e.workout_id
-            WHERE e.workout_id = ? AND w.tg_id = ? AND e.name = ?
-            ORDER BY e.set_index ASC
-        """, (workout_id, tg_id, name))
-    else:
-        cur.execute("""
-            SELECT e.set_index, e.weight, e.target_reps, e.actual_reps
-            FROM exercises e JOIN workouts w ON w.id = e.workout_id
-            WHERE w.tg_id = ? AND w.date = ? AND e.name = ?
-            ORDER BY e.set_index ASC
-        """, (tg_id, cache.get("date"), name))
-    rows = cur.fetchall(); conn.close()
+    rows = await get_exercise_sets(tg_id, name, workout_id=workout_id, date=cache.get("date"))
     if not rows:
         await callback.answer("Нет подходов", show_alert=False); return
 
     set_indices = [r["set_index"] for r in rows]
-    EXPECT_INPUT[tg_id] = {"workout_id": workout_id if workout_id else None, "name": name,
-                           "set_indices": set_indices, "date": EX_CACHE.get(tg_id, {}).get("date")}
+    await EXPECT_INPUT.set(tg_id, {"workout_id": workout_id if workout_id else None, "name": name,
+                                   "set_indices": set_indices, "date": cache.get("date")})
 
     icon = exercise_status_icon(rows)
     lines = [f"<b>{icon + ' ' if icon else ''}{name}</b>"] + [
@@ -357,7 +392,7 @@ async def plan_open_exercise(callback: CallbackQuery):
 @router.message(F.text)
 async def input_actual_reps(message: Message):
     tg_id = message.from_user.id
-    pending = EXPECT_INPUT.get(tg_id)
+    pending = await EXPECT_INPUT.get(tg_id)
     if not pending:
         return
     expected_cnt = len(pending.get("set_indices", []))
@@ -383,53 +418,13 @@ async def input_actual_reps(message: Message):
         return
 
     name = pending["name"]; workout_id = pending.get("workout_id"); date = pending.get("date")
-    conn = get_connection(); cur = conn.cursor()
-    if workout_id:
-        cur.execute("""
-            SELECT e.id, e.set_index
-            FROM exercises e JOIN workouts w ON w.id = e.workout_id
-            WHERE e.workout_id = ? AND w.tg_id = ? AND e.name = ?
-            ORDER BY e.set_index ASC
-        """, (workout_id, tg_id, name))
-    else:
-        cur.execute("""
-            SELECT e.id, e.set_index
-            FROM exercises e JOIN workouts w ON w.id = e.workout_id
-            WHERE w.tg_id = ? AND w.date = ? AND e.name = ?
-            ORDER BY e.set_index ASC
-        """, (tg_id, date, name))
-    rows = cur.fetchall()
-    if not rows:
-        conn.close()
-        EXPECT_INPUT.pop(tg_id, None)
+    saved = await save_actual_reps(tg_id, name, reps, workout_id=workout_id, date=date)
+    if saved is None:
+        await EXPECT_INPUT.pop(tg_id)
         await message.answer("Не нашёл подходы для обновления. Сформируй план заново.")
         return
-
-    cnt = 0
-    for i, row in enumerate(rows):
-        if i >= len(reps): break
-        cur.execute("UPDATE exercises SET actual_reps = ? WHERE id = ?", (reps[i], row["id"]))
-        cnt += 1
-    conn.commit(); conn.close()
-    EXPECT_INPUT.pop(tg_id, None)
-
-    # re-render
-    conn2 = get_connection(); cur2 = conn2.cursor()
-    if workout_id:
-        cur2.execute("""
-            SELECT e.set_index, e.weight, e.target_reps, e.actual_reps
-            FROM exercises e JOIN workouts w ON w.id = e.workout_id
-            WHERE e.workout_id = ? AND w.tg_id = ? AND e.name = ?
-            ORDER BY e.set_index ASC
-        """, (workout_id, tg_id, name))
-    else:
-        cur2.execute("""
-            SELECT e.set_index, e.weight, e.target_reps, e.actual_reps
-            FROM exercises e JOIN workouts w ON w.id = e.workout_id
-            WHERE w.tg_id = ? AND w.date = ? AND e.name = ?
-            ORDER BY e.set_index ASC
-        """, (tg_id, date, name))
-    rows2 = cur2.fetchall(); conn2.close()
+    cnt, rows2 = saved
+    await EXPECT_INPUT.pop(tg_id)
 
     icon2 = exercise_status_icon(rows2)
     lines = [f"<b>{icon2 + ' ' if icon2 else ''}{name}</b>"] + [
@@ -442,54 +437,18 @@ async def input_actual_reps(message: Message):
 @router.callback_query(F.data == "plan:back")
 async def plan_back(callback: CallbackQuery):
     tg_id = callback.from_user.id
-    cache = EX_CACHE.get(tg_id)
+    cache = await _plan_session(tg_id)
     if not cache:
-        today = datetime.now(timezone.utc).date().strftime("%Y-%m-%d")
-        conn = get_connection(); cur = conn.cursor()
-        mrow = cur.execute("SELECT training_type FROM users WHERE tg_id = ?", (tg_id,)).fetchone()
-        mode_val = mrow[0] if mrow and (len(mrow) > 0) else None
-        if mode_val:
-            cur.execute(
-                """
-                SELECT DISTINCT e.name
-                FROM exercises e JOIN workouts w ON w.id = e.workout_id
-                WHERE w.tg_id = ? AND w.date = ? AND e.training_type = ?
-                ORDER BY e.name COLLATE NOCASE
-                """,
-                (tg_id, today, mode_val),
-            )
-        else:
-            cur.execute(
-                """
-                SELECT DISTINCT e.name
-                FROM exercises e JOIN workouts w ON w.id = e.workout_id
-                WHERE w.tg_id = ? AND w.date = ?
-                ORDER BY e.name COLLATE NOCASE
-                """,
-                (tg_id, today),
-            )
-        names = [r[0] for r in cur.fetchall()]; conn.close()
-        if not names:
-            await callback.message.edit_text("На сегодня упражнений не найдено."); await callback.answer(); return
-        EX_CACHE[tg_id] = {"date": today, "names": names, "workout_id": None}
-    else:
-        names = cache.get("names", [])
+        await callback.message.edit_text("На сегодня упражнений не найдено."); await callback.answer(); return
+    names = cache["names"]
 
-    rows = []; wid = cache.get("workout_id") if cache else None
+    rows = []; wid = cache.get("workout_id")
     if wid:
-        conn = get_connection(); cur = conn.cursor()
+        _, sets_by_name = await get_workout_sets(tg_id, wid)
         for i, name in enumerate(names, start=1):
-            cur.execute("""
-                SELECT e.set_index, e.target_reps, e.actual_reps
-                FROM exercises e JOIN workouts w ON w.id = e.workout_id
-                WHERE e.workout_id = ? AND w.tg_id = ? AND e.name = ?
-                ORDER BY e.set_index ASC
-            """, (wid, tg_id, name))
-            rset = cur.fetchall()
-            icon = exercise_status_icon(rset)
+            icon = exercise_status_icon(sets_by_name.get(name, []))
             label = f"{icon} {name}" if icon else name
             rows.append([InlineKeyboardButton(text=label, callback_data=f"plan:ex:{i}")])
-        conn.close()
         rows.append([InlineKeyboardButton(text="🗑 Удалить тренировку", callback_data=f"plan:del:{wid}")])
     else:
         rows = [[InlineKeyboardButton(text=n, callback_data=f"plan:ex:{i}")] for i, n in enumerate(names, start=1)]
@@ -507,9 +466,7 @@ async def plan_delete(callback: CallbackQuery):
     except Exception:
         await callback.answer("Ошибка id тренировки", show_alert=False); return
 
-    conn = get_connection(); cur = conn.cursor()
-    row = cur.execute("SELECT id, date FROM workouts WHERE id = ? AND tg_id = ?", (wid, tg_id)).fetchone()
-    conn.close()
+    row = await get_workout(tg_id, wid)
     if not row:
         await callback.answer("Нет доступа к этой тренировке", show_alert=False); return
 
@@ -532,18 +489,12 @@ async def plan_delete_confirm(callback: CallbackQuery):
     except Exception:
         await callback.answer("Ошибка id тренировки", show_alert=False); return
 
-    conn = get_connection(); cur = conn.cursor()
-    row = cur.execute("SELECT id FROM workouts WHERE id = ? AND tg_id = ?", (wid, tg_id)).fetchone()
-    if not row:
-        conn.close(); await callback.answer("Нет доступа к этой тренировке", show_alert=False); return
-
-    cur.execute("DELETE FROM exercises WHERE workout_id = ?", (wid,))
-    cur.execute("DELETE FROM workouts WHERE id = ?", (wid,))
-    conn.commit(); conn.close()
+    if not await delete_workout(tg_id, wid):
+        await callback.answer("Нет доступа к этой тренировке", show_alert=False); return
 
-    if EX_CACHE.get(tg_id, {}).get("workout_id") == wid:
-        EX_CACHE.pop(tg_id, None)
-    EXPECT_INPUT.pop(tg_id, None)
+    if ((await EX_CACHE.get(tg_id)) or {}).get("workout_id") == wid:
+        await EX_CACHE.pop(tg_id)
+    await EXPECT_INPUT.pop(tg_id)
 
     await callback.message.edit_text("Тренировка удалена.")
     await callback.answer()
\ No newline at end of file
@@ -2,7 +2,7 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from states import ProfileFSM, ProfileFullFSM, OnboardFSM
-from db import get_connection
+from services.repository import update_user, update_profile, get_profile, get_prompt_and_mode, get_onboarding
 from keyboards import profile_inline_kb
 from utils.formatting import format_profile_card
 from utils.parsing import parse_profile_update
@@ -26,24 +26,14 @@ def _default_prompt_for_mode(mode_value: str | None) -> str:
 @router.message(F.text == "Посмотреть профиль")
 async def view_profile(message: Message):
     tg_id = message.from_user.id
-    conn = get_connection()
-    row = conn.execute(
-        "SELECT name, age, height, weight, goal, experience, gender FROM users WHERE tg_id = ?",
-        (tg_id,)
-    ).fetchone()
-    conn.close()
+    row = await get_profile(tg_id)
     await message.answer(format_profile_card(row), parse_mode="HTML", reply_markup=profile_inline_kb())
 
 # --- Изменение пользовательской инструкции (prompt) ------------------------
 @router.message(F.text.casefold() == "изменить инструкцию")
 async def edit_prompt_from_reply(message: Message, state: FSMContext):
     tg_id = message.from_user.id
-    conn = get_connection()
-    row = conn.execute(
-        "SELECT prompt, training_type FROM users WHERE tg_id = ?",
-        (tg_id,)
-    ).fetchone()
-    conn.close()
+    row = await get_prompt_and_mode(tg_id)
 
     user_prompt = (row["prompt"] if row and row["prompt"] else None)
     mode_value = None
@@ -62,12 +52,7 @@ async def edit_prompt_from_reply(message: Message, state: FSMContext):
 async def edit_prompt_from_inline(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
     tg_id = callback.from_user.id
-    conn = get_connection()
-    row = conn.execute(
-        "SELECT prompt, training_type FROM users WHERE tg_id = ?",
-        (tg_id,)
-    ).fetchone()
-    conn.close()
+    row = await get_prompt_and_mode(tg_id)
 
     user_prompt = (row["prompt"] if row and row["prompt"] else None)
     mode_value = None
@@ -94,9 +79,7 @@ async def edit_prompt_save(message: Message, state: FSMContext):
 
     # Сброс на дефолтный промпт (храним NULL)
     if text.lower() == "/default":
-        conn = get_connection(); cur = conn.cursor()
-        cur.execute("UPDATE users SET prompt = NULL WHERE tg_id = ?", (tg_id,))
-        conn.commit(); conn.close()
+        await update_user(tg_id, prompt=None)
         await state.clear()
         await message.answer("Сбросил на дефолт")
         return
@@ -105,9 +88,7 @@ async def edit_prompt_save(message: Message, state: FSMContext):
         await message.answer("Инструкция не может быть пустой. Пришлите текст, либо /cancel, либо /default.")
         return
 
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET prompt = ? WHERE tg_id = ?", (text, tg_id))
-    conn.commit(); conn.close()
+    await update_user(tg_id, prompt=text)
 
     await state.clear()
     await message.answer("Инструкция сохранена ✅")
@@ -140,9 +121,7 @@ async def set_mode(callback: CallbackQuery):
     mode = data[1] if len(data) == 2 else "strength"
     human = "Силовая" if mode == "strength" else "Йога/Пилатес"
 
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET training_type = ? WHERE tg_id = ?", (mode, callback.from_user.id))
-    conn.commit(); conn.close()
+    await update_user(callback.from_user.id, training_type=mode)
 
     await callback.message.answer(f"Режим установлен: {human} ✅")
     await callback.answer()
@@ -154,28 +133,14 @@ async def profile_update_input(message: Message, state: FSMContext):
         await message.answer("Неправильный формат. Пример: Имя Алеша, Возраст 39, Рост 173")
         return
     tg_id = message.from_user.id
-    conn = get_connection(); cur = conn.cursor()
-    set_clause = ", ".join(f"{k} = ?" for k in data.keys())
-    values = list(data.values()) + [tg_id]
-    cur.execute(f"UPDATE users SET {set_clause} WHERE tg_id = ?", values)
-    conn.commit()
-    row = cur.execute(
-        "SELECT name, age, height, weight, goal, experience, gender FROM users WHERE tg_id = ?",
-        (tg_id,)
-    ).fetchone()
-    conn.close()
+    row = await update_profile(tg_id, data)
     await state.clear()
     await message.answer(format_profile_card(row), parse_mode="HTML", reply_markup=profile_inline_kb())
 
 @router.callback_query(F.data == "profile:refresh_form")
 async def profile_refresh_form(callback: CallbackQuery, state: FSMContext):
     tg_id = callback.from_user.id
-    conn = get_connection()
-    ob = conn.execute(
-        "SELECT bench_max_kg, squat_max_kg, pullups_reps, deadlift_max_kg, ohp_max_kg, dips_reps FROM users WHERE tg_id = ?",
-        (tg_id,)
-    ).fetchone()
-    conn.close()
+    ob = await get_onboarding(tg_id)
     prev = dict(ob) if ob else {}
     lines = [
         "Обновим анкету. Пришли новые значения по очереди на вопросы.\n",
@@ -204,9 +169,7 @@ async def pf_name(message: Message, state: FSMContext):
     if not v:
         await message.answer("Имя не должно быть пустым. Введи имя ещё раз.")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET name = ? WHERE tg_id = ?", (v, message.from_user.id))
-    conn.commit(); conn.close()
+    await update_user(message.from_user.id, name=v)
     await state.set_state(ProfileFullFSM.age)
     await message.answer("Возраст (целое число, лет):")
 
@@ -216,9 +179,7 @@ async def pf_age(message: Message, state: FSMContext):
     if not _is_int(t) or not (1 <= int(t) <= 120):
         await message.answer("Введите корректный возраст (целое число 1–120).")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET age = ? WHERE tg_id = ?", (int(t), message.from_user.id))
-    conn.commit(); conn.close()
+    await update_user(message.from_user.id, age=int(t))
     await state.set_state(ProfileFullFSM.height)
     await message.answer("Рост (см, целое число):")
 
@@ -228,9 +189,7 @@ async def pf_height(message: Message, state: FSMContext):
     if not _is_int(t) or not (100 <= int(t) <= 250):
         await message.answer("Введите рост в см (целое число 100–250).")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET height = ? WHERE tg_id = ?", (int(t), message.from_user.id))
-    conn.commit(); conn.close()
+    await update_user(message.from_user.id, height=int(t))
     await state.set_state(ProfileFullFSM.weight)
     await message.answer("Вес (кг, целое число):")
 
@@ -240,9 +199,7 @@ async def pf_weight(message: Message, state: FSMContext):
     if not _is_int(t) or not (30 <= int(t) <= 400):
         await message.answer("Введите вес (целое число 30–400).")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET weight = ? WHERE tg_id = ?", (int(t), message.from_user.id))
-    conn.commit(); conn.close()
+    await update_user(message.from_user.id, weight=int(t))
     await state.set_state(ProfileFullFSM.gender)
     await message.answer("Пол (мужской/женский):")
 
@@ -257,9 +214,7 @@ async def pf_gender(message: Message, state: FSMContext):
     if gender not in ("мужской", "женский"):
         await message.answer("Пол должен быть: мужской/женский. Введи ещё раз.")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET gender = ? WHERE tg_id = ?", (gender, message.from_user.id))
-    conn.commit(); conn.close()
+    await update_user(message.from_user.id, gender=gender)
     await state.set_state(ProfileFullFSM.goal)
     await message.answer("Цель тренировки: сила / масса / сушка / общая форма — введи одно из них:")
 
@@ -270,9 +225,7 @@ async def pf_goal(message: Message, state: FSMContext):
     if goal not in {"сила","масса","сушка","общая форма"}:
         await message.answer("Варианты цели: сила, масса, сушка, общая форма. Введи одно из них.")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET goal = ? WHERE tg_id = ?", (goal, message.from_user.id))
-    conn.commit(); conn.close()
+    await update_user(message.from_user.id, goal=goal)
     await state.set_state(ProfileFullFSM.experience)
     await message.answer("Опыт: новичок / средний / продвинутый")
 
@@ -282,9 +235,7 @@ async def pf_experience(message: Message, state: FSMContext):
     if raw not in {"новичок","средний","продвинутый"}:
         await message.answer("Варианты опыта: новичок / средний / продвинутый. Введи одно из них.")
         return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE users SET experience = ? WHERE tg_id = ?", (raw, message.from_user.id))
-    conn.commit(); conn.close()
+    await update_user(message.from_user.id, experience=raw)
     # переход к силовой анкете (онбординг по базовым лифтам)
     from states import OnboardFSM
     await state.set_state(OnboardFSM.bench)
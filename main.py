@@ -1,19 +1,125 @@
 import asyncio
+import logging
+import multiprocessing
 from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN
-from db import init_db
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from config import (
+    BOT_TOKEN, BOT_MODE, BOT_API_URL, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBAPP_HOST, WEBAPP_PORT, WEB_WORKERS, METRICS_PATH,
+)
+from db import init_db, close_db
 from handlers import register_all_handlers
+from handlers.plan import PLAN_JOBS
 from middlewares.admin_only import AdminOnlyMiddleware
+from middlewares.metrics import setup_metrics
+from services import metrics
+from services.openai_client import close_openai_clients
+from services.planner_pool import start_planner_pool, close_planner_pool
+from services.storage import create_fsm_storage
+from utils.logging_setup import setup_logging
 
-async def main():
-    init_db()
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+logger = logging.getLogger("trainer")
+
+
+def create_bot() -> Bot:
+    # BOT_API_URL — свой Bot API сервер или локальная заглушка (тесты вебхука без Telegram)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_URL)) if BOT_API_URL else None
+    return Bot(token=BOT_TOKEN, session=session)
+
+
+def create_dispatcher() -> Dispatcher:
+    dp = Dispatcher(storage=create_fsm_storage())
+    setup_metrics(dp)
     dp.message.middleware(AdminOnlyMiddleware())
     dp.callback_query.middleware(AdminOnlyMiddleware())
     register_all_handlers(dp)
-    print("Trainer bot is running…")
+    dp.startup.register(start_planner_pool)
+    # сначала дожидаемся отмены задач планов — им ещё нужны БД и клиент OpenAI
+    dp.shutdown.register(PLAN_JOBS.stop)
+    dp.shutdown.register(close_db)
+    dp.shutdown.register(close_openai_clients)
+    dp.shutdown.register(close_planner_pool)
+    return dp
+
+
+async def run_polling():
+    bot = create_bot()
+    dp = create_dispatcher()
+    logger.info("Trainer bot is running (polling)…")
+    # если раньше работали через вебхук — снимаем его, иначе getUpdates вернёт конфликт
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
+
+# --- webhook -----------------------------------------------------------------
+
+def create_app(bot: Bot, dp: Dispatcher, set_webhook: bool = True):
+    """
+    aiohttp-приложение: POST WEBHOOK_PATH принимает апдейты Telegram.
+    Локально можно слать записанные апдейты curl'ом — без WEBHOOK_BASE_URL setWebhook не вызывается.
+    """
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET or None).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    async def metrics_handler(request):
+        # метрики своего процесса; при WEB_WORKERS > 1 различаются меткой worker
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Prometheus-Format": "0.0.4"})
+    app.router.add_get(METRICS_PATH, metrics_handler)
+
+    if set_webhook and WEBHOOK_BASE_URL:
+        async def on_startup(bot: Bot):
+            await bot.set_webhook(f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET or None)
+        dp.startup.register(on_startup)
+    return app
+
+
+def serve_webhook(worker: int = 0):
+    from aiohttp import web
+
+    setup_logging()  # воркер — отдельный процесс (spawn), main() в нём не выполнялся
+    if WEB_WORKERS > 1:
+        metrics.REGISTRY.const_labels["worker"] = str(worker)
+    bot = create_bot()
+    dp = create_dispatcher()
+    # setWebhook достаточно одного, делает его первый воркер
+    app = create_app(bot, dp, set_webhook=worker == 0)
+    logger.info("Trainer bot is running (webhook, worker %d) on %s:%d%s…", worker, WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+    web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT, reuse_port=WEB_WORKERS > 1, print=None)
+
+
+def run_webhook():
+    if WEB_WORKERS == 1:
+        serve_webhook()
+        return
+    # несколько процессов слушают один порт (SO_REUSEPORT), ядро делит между ними соединения;
+    # состояние общее через SQLite/WAL (FSM и сессии в БД, см. services.storage)
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=serve_webhook, args=(i,), name=f"trainer-web-{i}") for i in range(WEB_WORKERS)]
+    for p in workers:
+        p.start()
+    try:
+        for p in workers:
+            p.join()
+    except KeyboardInterrupt:
+        for p in workers:
+            p.join()
+
+
+def main():
+    setup_logging()
+    # схему создаём/мигрируем один раз, до запуска воркеров
+    init_db()
+    if BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        asyncio.run(run_polling())
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    main()
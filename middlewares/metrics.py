@@ -0,0 +1,55 @@
+import asyncio
+import time
+from aiogram import BaseMiddleware, Dispatcher
+
+from config import METRICS_LOG_INTERVAL
+from services import metrics
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Outer-middleware апдейта: время обработки целиком, вместе с SQLite и OpenAI,
+    которые db.Database.run и openai_client записывают в тот же UpdateStats.
+    """
+
+    async def __call__(self, handler, event, data):
+        stats, token = metrics.begin_update()
+        t0 = time.perf_counter()
+        error = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.end_update(stats, token, time.perf_counter() - t0, error)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Inner-middleware: подписывает текущий апдейт именем выбранного хендлера."""
+
+    async def __call__(self, handler, event, data):
+        stats = metrics.current_update()
+        h = data.get("handler")
+        if stats is not None and h is not None:
+            stats.handler = getattr(h.callback, "__name__", "unknown")
+        return await handler(event, data)
+
+
+def setup_metrics(dp: Dispatcher):
+    dp.update.outer_middleware(MetricsMiddleware())
+    dp.message.middleware(HandlerNameMiddleware())
+    dp.callback_query.middleware(HandlerNameMiddleware())
+
+    if METRICS_LOG_INTERVAL > 0:
+        tasks: list[asyncio.Task] = []
+
+        async def on_startup():
+            tasks.append(asyncio.create_task(metrics.report_periodically(METRICS_LOG_INTERVAL)))
+
+        async def on_shutdown():
+            for t in tasks:
+                t.cancel()
+
+        dp.startup.register(on_startup)
+        dp.shutdown.register(on_shutdown)
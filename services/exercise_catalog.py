@@ -0,0 +1,120 @@
+# --- Exercise catalogue --------------------------------------------------------
+"""
+Каталог упражнений силового планировщика — единый источник правды для
+классификации по группам мышц и оценки стартового веса (local_planer).
+
+Поиск O(1): словарь по нормализованному (и интернированному) названию, куда
+попадают канонические имена и алиасы. Названия не из каталога (например, из
+AI-планов) классифицируются по ключевым словам один раз и запоминаются.
+"""
+from functools import lru_cache
+from sys import intern
+from typing import Dict, NamedTuple, Optional, Tuple
+
+# группы мышц
+CHEST = "chest"; TRIS = "tris"; SHOULD = "should"; LEGS = "legs"; BACK = "back"; BICEPS = "biceps"; ABS = "abs"
+
+# базовые лифты — источники 1ПМ
+BENCH = "bench"; CGBP = "cgbp"; SQUAT = "squat"; DEADLIFT = "deadlift"; OHP = "ohp"
+BODYWEIGHT = "bodyweight"  # вес тела + отягощение (подтягивания)
+
+# лифт -> (ключи анкеты/профиля после нормализации, названия в истории для оценки 1ПМ)
+LIFTS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    BENCH: (("жим_лежа_макс_кг", "bench_max_kg", "1пм_жим_лежа", "1rm_bench"),
+            ("жим штанги лежа", "жим лежа (штанга)")),
+    CGBP: (("узкий_жим_макс_кг", "cgbp_max_kg", "узкий_жим_штанги_лежа_макс_кг", "жим_узким_хватом_макс_кг", "узкий_жим_лежа_макс_кг"),
+           ("узкий жим штанги лежа", "жим узким хватом")),
+    SQUAT: (("присед_макс_кг", "squat_max_kg", "1rm_squat", "1пм_присед"),
+            ("приседания со штангой",)),
+    DEADLIFT: (("становая_макс_кг", "deadlift_max_kg", "1rm_deadlift", "1пм_становая"),
+               ("становая тяга", "становая тяга классическая (штанга)")),
+    OHP: (("ohp_max_kg", "армейский_жим_макс_кг", "1rm_ohp"),
+          ("жим штанги стоя", "армейский жим")),
+}
+
+
+class Exercise(NamedTuple):
+    name: str                        # каноническое название (как в плане)
+    group: Optional[str]             # группа мышц
+    lift: Optional[str] = None       # от какого лифта считаем вес
+    ratio: Optional[float] = None    # доля от веса лифта на эти повторы; None — сам лифт
+    fallback: Optional[int] = None   # вес, если 1ПМ неизвестен
+    aliases: Tuple[str, ...] = ()
+
+
+CATALOG: Tuple[Exercise, ...] = (
+    # грудь
+    Exercise("Жим штанги лежа", CHEST, BENCH),
+    Exercise("Жим гантелей на наклонной скамье", CHEST, BENCH, 0.85),
+    Exercise("Жим штанги на наклонной скамье", CHEST, BENCH, 0.85),
+    Exercise("Сведение рук в тренажере", CHEST, BENCH, 0.55, 45),
+    Exercise("Кроссовер верхних блоков", CHEST, BENCH, 0.55, 45),
+    # трицепс
+    Exercise("Узкий жим штанги лежа", TRIS, CGBP),
+    Exercise("Французский жим лёжа", TRIS, CGBP, 0.55, 30),
+    Exercise("Разгибания на трицепс на канате", TRIS, CGBP, 0.50, 25),
+    # ноги
+    Exercise("Приседания со штангой", LEGS, SQUAT),
+    Exercise("Жим ногами в тренажере", LEGS, SQUAT, 2.2, 140),
+    Exercise("Сгибания ног лёжа в тренажере", LEGS, SQUAT, 0.55, 35),
+    Exercise("Разгибания ног в тренажере", LEGS, SQUAT, 0.60, 40),
+    Exercise("Подъемы на носки стоя в тренажере", LEGS, SQUAT, 0.9, 80),
+    # спина
+    Exercise("Становая тяга", BACK, DEADLIFT, aliases=("Становая тяга классическая (штанга)",)),
+    Exercise("Тяга штанги в наклоне", BACK, DEADLIFT, 0.6, 60),
+    Exercise("Тяга вертикального блока", BACK, DEADLIFT, 0.5, 60),
+    Exercise("Тяга горизонтального блока", BACK, DEADLIFT, 0.5, 60),
+    Exercise("Подтягивания с весом", BACK, BODYWEIGHT),
+    # плечи
+    Exercise("Жим штанги стоя", SHOULD, OHP, aliases=("Армейский жим",)),
+    Exercise("Махи гантелями в стороны", SHOULD, OHP, 0.25, 8),
+    # бицепс
+    Exercise("Подъем штанги на бицепс", BICEPS, BENCH, 0.45, 35),
+    Exercise("Молотковые сгибания гантелей", BICEPS, BENCH, 0.25, 16),
+    # пресс
+    Exercise("Скручивания на канате", ABS, fallback=0),
+    Exercise("Подъем ног в висе", ABS, fallback=0),
+)
+
+# ключевые слова для названий вне каталога; порядок групп важен
+_GROUP_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    (CHEST, ("жим штанги лежа", "жим гантелей", "жим штанги на наклонной", "сведение рук", "кроссовер")),
+    (TRIS, ("узкий жим", "разгибани", "трицепс", "французский жим")),
+    (SHOULD, ("жим штанги стоя", "армейский жим", "жим стоя", "мах", "плеч")),
+    (LEGS, ("присед", "жим ногами", "сгибания ног", "икр", "носки")),
+    (BACK, ("становая", "тяга штанги в наклоне", "тяга горизонтального блока", "тяга вертикального блока", "подтягиван")),
+    (BICEPS, ("бицепс", "молотков")),
+    (ABS, ("скручивания", "подъем ног", "пресс")),
+)
+
+
+def norm_name(n: Optional[str]) -> str:
+    return (n or "").strip().lower().replace("ё", "е")
+
+
+_BY_NAME: Dict[str, Exercise] = {}
+for _ex in CATALOG:
+    for _n in (_ex.name, *_ex.aliases):
+        _BY_NAME[intern(norm_name(_n))] = _ex
+
+
+def lookup(name: Optional[str]) -> Optional[Exercise]:
+    """Упражнение каталога по названию (каноническому или алиасу) или None."""
+    return _BY_NAME.get(norm_name(name))
+
+
+@lru_cache(maxsize=4096)
+def _group_by_keywords(n: str) -> Optional[str]:
+    for group, keys in _GROUP_KEYWORDS:
+        if any(k in n for k in keys):
+            return group
+    return None
+
+
+def muscle_group(name: Optional[str]) -> Optional[str]:
+    n = norm_name(name)
+    ex = _BY_NAME.get(n)
+    if ex is not None:
+        return ex.group
+    return _group_by_keywords(n)
+# --- /Exercise catalogue -------------------------------------------------------
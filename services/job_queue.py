@@ -0,0 +1,124 @@
+"""
+Фоновая очередь задач в event loop'е: хендлер ставит задачу и сразу возвращается,
+выполняют её не больше workers воркеров.
+
+- одна задача в полёте на ключ (tg_id): повторная постановка, пока прежняя стоит или
+  выполняется, отклоняется (submit → False);
+- приоритеты: меньшее число — раньше (локальный план не ждёт за AI-планами);
+- глубина очереди, число выполняемых задач и счётчики видны в services.metrics;
+- каждая задача учитывается как отдельный «апдейт» <queue>_job:<name> (время, SQLite, OpenAI):
+  апдейт, поставивший её, к этому моменту уже завершён и отчитался.
+"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Hashable
+
+from services import metrics
+from services.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, name: str, workers: int = 4, maxsize: int = 0):
+        self.name = name
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self._queue: asyncio.PriorityQueue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._inflight: dict[Hashable, asyncio.Future] = {}   # ключ -> «задача завершена»
+        self._seq = itertools.count()
+        self.running = 0
+        self.stats = {"submitted": 0, "deduplicated": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self.wait_seconds = 0.0     # суммарное ожидание в очереди
+        register_collector(self._metrics)
+
+    def _ensure_started(self):
+        # очередь и воркеры создаются в работающем loop'е, при первой задаче
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(self.maxsize)
+        if not self._tasks:
+            # пустой контекст: иначе воркер навсегда унаследует UpdateStats апдейта, поставившего первую задачу
+            self._tasks = [asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}",
+                                               context=contextvars.Context())
+                           for i in range(self.workers)]
+
+    def is_duplicate(self, key: Hashable) -> bool:
+        """По ключу уже есть задача в полёте — новую ставить не нужно (учитывается в deduplicated)."""
+        if key in self._inflight:
+            self.stats["deduplicated"] += 1
+            return True
+        return False
+
+    def submit(self, key: Hashable, priority: int, job: Callable[[], Awaitable[None]], name: str = "job") -> bool:
+        """
+        Поставить job() в очередь. False — по ключу уже есть задача в полёте (ничего не поставлено).
+        asyncio.QueueFull — очередь переполнена (maxsize). name — метка задачи в метриках.
+        """
+        if self.is_duplicate(key):
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((priority, next(self._seq), time.monotonic(), key, name, job))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+        self.stats["submitted"] += 1
+        return True
+
+    async def wait(self, key: Hashable):
+        """Дождаться задачи по ключу (если она есть)."""
+        done = self._inflight.get(key)
+        if done is not None:
+            await asyncio.shield(done)
+
+    async def _worker(self):
+        while True:
+            _, _, queued_at, key, name, job = await self._queue.get()
+            self.wait_seconds += time.monotonic() - queued_at
+            self.running += 1
+            stats, token = metrics.begin_update()
+            stats.handler = f"{self.name}_job:{name}"
+            t0 = time.perf_counter()
+            error = False
+            try:
+                await job()
+                self.stats["completed"] += 1
+            except Exception:
+                error = True
+                self.stats["failed"] += 1
+                logger.exception("%s: задача %s упала", self.name, key)
+            finally:
+                metrics.end_update(stats, token, time.perf_counter() - t0, error)
+                self.running -= 1
+                self._queue.task_done()
+                done = self._inflight.pop(key, None)
+                if done is not None and not done.done():
+                    done.set_result(None)
+
+    async def stop(self):
+        """Остановить воркеров (shutdown); невыполненные задачи теряются."""
+        pending = self._queue.qsize() if self._queue else 0
+        if pending:
+            logger.warning("%s: остановка, в очереди осталось %d задач", self.name, pending)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        for done in self._inflight.values():
+            if not done.done():
+                done.cancel()
+        self._inflight.clear()
+
+    def _metrics(self):
+        labels = {"queue": self.name}
+        return [
+            ("trainer_job_queue_depth", labels, self._queue.qsize() if self._queue else 0),
+            ("trainer_job_queue_running", labels, self.running),
+            ("trainer_job_queue_wait_seconds_total", labels, self.wait_seconds),
+        ] + [(f"trainer_job_queue_{k}_total", labels, v) for k, v in self.stats.items()]
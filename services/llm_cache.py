@@ -0,0 +1,125 @@
+"""
+Кеш ответов OpenAI по содержимому запроса.
+
+Ключ — sha256 от модели и итоговых messages (в них уже резолвленный промпт и payload),
+значение — текст ответа в таблице llm_cache с TTL (см. db.init_db). Одинаковые запросы,
+пришедшие одновременно (двойной тап, два воркера хендлера), склеиваются single-flight'ом:
+к API идёт только первый, остальные ждут его результат. Single-flight — в пределах процесса;
+между процессами общий только SQLite-кеш.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Awaitable, Callable
+
+from config import OPENAI_CACHE_TTL
+from db import get_db
+from services.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+_SQL_GET = "SELECT response FROM llm_cache WHERE key = ? AND expires_at > ?"
+_SQL_HIT = "UPDATE llm_cache SET hits = hits + 1 WHERE key = ?"
+_SQL_SET = """
+    INSERT INTO llm_cache(key, model, response, created_at, expires_at, hits) VALUES (?, ?, ?, ?, ?, 0)
+    ON CONFLICT(key) DO UPDATE SET response = excluded.response, created_at = excluded.created_at,
+                                   expires_at = excluded.expires_at, hits = 0
+"""
+_SQL_PURGE = "DELETE FROM llm_cache WHERE expires_at <= ?"
+# как часто (в записях) подчищать просроченные ответы
+_PURGE_EVERY = 100
+
+_inflight: dict[str, asyncio.Future] = {}
+stats = {"hits": 0, "misses": 0, "coalesced": 0, "stores": 0}
+
+
+def cache_key(model: str, messages: list[dict]) -> str:
+    raw = json.dumps({"model": model, "messages": messages}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def get(key: str) -> str | None:
+    def job(conn):
+        row = conn.execute(_SQL_GET, (key, time.time())).fetchone()
+        if row:
+            conn.execute(_SQL_HIT, (key,))
+        return row["response"] if row else None
+    return await get_db().run(job)
+
+
+async def put(key: str, model: str, response: str, ttl: float = OPENAI_CACHE_TTL):
+    now = time.time()
+    stats["stores"] += 1
+    purge = stats["stores"] % _PURGE_EVERY == 0
+
+    def job(conn):
+        conn.execute(_SQL_SET, (key, model, response, now, now + ttl))
+        if purge:
+            conn.execute(_SQL_PURGE, (now,))
+    await get_db().run(job)
+
+
+def _consume(fut: asyncio.Future):
+    # исключение ведущего без ожидающих не должно сыпать «exception was never retrieved»
+    if not fut.cancelled():
+        fut.exception()
+
+
+async def cached_call(key: str, model: str, call: Callable[[], Awaitable[str]],
+                      cacheable: Callable[[str], bool] = bool, refresh: bool = False) -> tuple[str, bool]:
+    """
+    Ответ из кеша или call(). Возвращает (text, from_cache).
+    В кеш попадают только ответы, для которых cacheable(text) — битые не закрепляем.
+    refresh=True — кеш не читаем (явная перегенерация), свежий ответ его перезаписывает.
+    """
+    if OPENAI_CACHE_TTL <= 0:
+        return await call(), False
+
+    text = None if refresh else await get(key)
+    if text is not None:
+        stats["hits"] += 1
+        return text, True
+
+    fut = _inflight.get(key)
+    if fut is not None:
+        stats["coalesced"] += 1
+        # shield: таймаут/отмена ожидающего не отменяет запрос ведущего
+        return await asyncio.shield(fut), True
+
+    stats["misses"] += 1
+    fut = asyncio.get_running_loop().create_future()
+    fut.add_done_callback(_consume)
+    _inflight[key] = fut
+    try:
+        text = await call()
+    except asyncio.CancelledError:
+        # ведущего отменили (обычно его таймаут) — ожидающим это выглядит как таймаут запроса
+        fut.set_exception(asyncio.TimeoutError())
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    else:
+        fut.set_result(text)
+    finally:
+        _inflight.pop(key, None)
+
+    if cacheable(text):
+        try:
+            await put(key, model, text)
+        except Exception:
+            logger.exception("llm_cache: не удалось сохранить ответ")
+    return text, False
+
+
+def _metrics():
+    lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+    return [(f"trainer_llm_cache_{k}_total", {}, v) for k, v in stats.items()] + [
+        ("trainer_llm_cache_inflight", {}, len(_inflight)),
+        ("trainer_llm_cache_hit_ratio", {}, (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0),
+    ]
+
+
+register_collector(_metrics)
@@ -0,0 +1,250 @@
+"""
+Метрики процесса в памяти: время хендлеров, SQLite и OpenAI в разрезе хендлера.
+
+Учёт ведётся на апдейт: middlewares.metrics.MetricsMiddleware открывает UpdateStats
+в contextvar, db.Database.run и openai_client добавляют туда своё время, по завершении
+апдейта всё сливается в REGISTRY под именем хендлера. Наружу — текст в формате
+Prometheus (render_prometheus, /metrics в режиме вебхука) и периодическая
+структурированная строка в лог (report_periodically).
+"""
+import asyncio
+import json
+import logging
+import time
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+logger = logging.getLogger("trainer.metrics")
+
+# границы гистограммы времени хендлера, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# (имя метрики, метки, значение); имя на _total — counter, иначе gauge
+Sample = tuple[str, dict, float]
+
+
+@dataclass
+class UpdateStats:
+    handler: str = "unhandled"
+    db_seconds: float = 0.0
+    db_calls: int = 0
+    db_queries: int = 0
+    openai_seconds: float = 0.0
+    openai_calls: int = 0
+
+
+_current: ContextVar[UpdateStats | None] = ContextVar("trainer_update_stats", default=None)
+
+
+class _HandlerMetrics:
+    __slots__ = ("count", "errors", "seconds", "buckets", "db_seconds", "db_calls", "db_queries",
+                 "openai_seconds", "openai_calls")
+
+    def __init__(self):
+        self.count = self.errors = self.db_calls = self.db_queries = self.openai_calls = 0
+        self.seconds = self.db_seconds = self.openai_seconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class Registry:
+    def __init__(self):
+        self.handlers: dict[str, _HandlerMetrics] = {}
+        self.const_labels: dict[str, str] = {}
+        # суммарно по процессу, включая работу вне апдейтов (startup, фоновые задачи)
+        self.db_seconds = 0.0
+        self.db_calls = 0
+        self.db_queries = 0
+        self.openai_seconds = 0.0
+        self.openai_calls = 0
+        self.openai_errors = 0
+        self._collectors: list[Callable[[], Iterable[Sample]]] = []
+
+    def observe_update(self, stats: UpdateStats, seconds: float, error: bool):
+        h = self.handlers.get(stats.handler)
+        if h is None:
+            h = self.handlers[stats.handler] = _HandlerMetrics()
+        h.count += 1
+        h.errors += error
+        h.seconds += seconds
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                h.buckets[i] += 1
+                break
+        h.db_seconds += stats.db_seconds
+        h.db_calls += stats.db_calls
+        h.db_queries += stats.db_queries
+        h.openai_seconds += stats.openai_seconds
+        h.openai_calls += stats.openai_calls
+
+    def register_collector(self, fn: Callable[[], Iterable[Sample]]):
+        """fn() -> [(имя, метки, значение)] — снимается при каждом render/snapshot (кеши, очереди)."""
+        self._collectors.append(fn)
+
+    def collect(self) -> list[Sample]:
+        out: list[Sample] = []
+        for fn in self._collectors:
+            try:
+                out.extend(fn())
+            except Exception:
+                logger.exception("metrics collector failed")
+        return out
+
+
+REGISTRY = Registry()
+
+
+# --- учёт -------------------------------------------------------------------
+
+def begin_update() -> tuple[UpdateStats, Token]:
+    stats = UpdateStats()
+    return stats, _current.set(stats)
+
+
+def end_update(stats: UpdateStats, token: Token, seconds: float, error: bool = False):
+    _current.reset(token)
+    REGISTRY.observe_update(stats, seconds, error)
+
+
+def current_update() -> UpdateStats | None:
+    return _current.get()
+
+
+def track_db(seconds: float, queries: int = 1):
+    r = REGISTRY
+    r.db_seconds += seconds; r.db_calls += 1; r.db_queries += queries
+    stats = _current.get()
+    if stats is not None:
+        stats.db_seconds += seconds; stats.db_calls += 1; stats.db_queries += queries
+
+
+def track_openai(seconds: float, error: bool = False):
+    r = REGISTRY
+    r.openai_seconds += seconds; r.openai_calls += 1; r.openai_errors += error
+    stats = _current.get()
+    if stats is not None:
+        stats.openai_seconds += seconds; stats.openai_calls += 1
+
+
+def register_collector(fn: Callable[[], Iterable[Sample]]):
+    REGISTRY.register_collector(fn)
+
+
+# --- вывод ------------------------------------------------------------------
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    esc = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, esc)) + "}"
+
+
+def render_prometheus(registry: Registry = REGISTRY) -> str:
+    """Текстовый формат экспозиции Prometheus 0.0.4."""
+    c = registry.const_labels
+    lines: list[str] = []
+
+    def family(name: str, kind: str, help_: str, samples: Iterable[tuple[str, dict, float]]):
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_labels({**c, **labels})} {value:g}")
+
+    hs = sorted(registry.handlers.items())
+
+    def hist(name: str, h: _HandlerMetrics):
+        acc = 0
+        for le, n in zip(BUCKETS, h.buckets):
+            acc += n
+            yield "_bucket", {"handler": name, "le": f"{le:g}"}, acc
+        yield "_bucket", {"handler": name, "le": "+Inf"}, h.count
+        yield "_sum", {"handler": name}, h.seconds
+        yield "_count", {"handler": name}, h.count
+
+    family("trainer_handler_seconds", "histogram", "Время обработки апдейта хендлером",
+           (s for name, h in hs for s in hist(name, h)))
+    family("trainer_handler_errors_total", "counter", "Апдейты, завершившиеся исключением",
+           (("", {"handler": n}, h.errors) for n, h in hs))
+    family("trainer_handler_db_seconds_total", "counter", "Время SQLite внутри хендлера",
+           (("", {"handler": n}, h.db_seconds) for n, h in hs))
+    family("trainer_handler_db_queries_total", "counter", "SQL-запросов внутри хендлера",
+           (("", {"handler": n}, h.db_queries) for n, h in hs))
+    family("trainer_handler_openai_seconds_total", "counter", "Время OpenAI внутри хендлера",
+           (("", {"handler": n}, h.openai_seconds) for n, h in hs))
+    family("trainer_db_seconds_total", "counter", "Время SQLite (весь процесс)", [("", {}, registry.db_seconds)])
+    family("trainer_db_calls_total", "counter", "Транзакций SQLite (весь процесс)", [("", {}, registry.db_calls)])
+    family("trainer_db_queries_total", "counter", "SQL-запросов (весь процесс)", [("", {}, registry.db_queries)])
+    family("trainer_openai_seconds_total", "counter", "Время запросов к OpenAI", [("", {}, registry.openai_seconds)])
+    family("trainer_openai_requests_total", "counter", "Запросов к OpenAI", [("", {}, registry.openai_calls)])
+    family("trainer_openai_errors_total", "counter", "Неудачных запросов к OpenAI", [("", {}, registry.openai_errors)])
+
+    by_name: dict[str, list[Sample]] = {}
+    for name, labels, value in registry.collect():
+        by_name.setdefault(name, []).append((name, labels, value))
+    for name, samples in by_name.items():
+        family(name, "counter" if name.endswith("_total") else "gauge", name,
+               (("", labels, value) for _, labels, value in samples))
+    return "\n".join(lines) + "\n"
+
+
+def snapshot(registry: Registry = REGISTRY) -> dict:
+    """Накопленные счётчики в виде словаря (для лога и отладки)."""
+    return {
+        "handlers": {
+            n: {"n": h.count, "errors": h.errors, "seconds": h.seconds, "db_seconds": h.db_seconds,
+                "db_queries": h.db_queries, "openai_seconds": h.openai_seconds, "openai_calls": h.openai_calls}
+            for n, h in registry.handlers.items()
+        },
+        "db": {"seconds": registry.db_seconds, "calls": registry.db_calls, "queries": registry.db_queries},
+        "openai": {"seconds": registry.openai_seconds, "calls": registry.openai_calls, "errors": registry.openai_errors},
+        "gauges": {f"{name}{_labels(labels)}": value for name, labels, value in registry.collect()},
+    }
+
+
+def _delta(cur: dict, prev: dict) -> dict:
+    out = {}
+    for k, v in cur.items():
+        if isinstance(v, dict):
+            d = _delta(v, prev.get(k, {}))
+            if d:
+                out[k] = d
+        elif v != prev.get(k, 0):
+            out[k] = round(v - prev.get(k, 0), 6)
+    return out
+
+
+def interval_report(cur: dict, prev: dict, interval: float) -> dict:
+    """Строка лога за интервал: по хендлерам n, среднее время, SQLite/OpenAI на апдейт."""
+    handlers = {}
+    for name, h in _delta(cur["handlers"], prev.get("handlers", {})).items():
+        n = h.get("n", 0)
+        if not n:
+            continue
+        handlers[name] = {
+            "n": n, "errors": h.get("errors", 0),
+            "avg_ms": round(h.get("seconds", 0) / n * 1000, 2),
+            "db_ms": round(h.get("db_seconds", 0) / n * 1000, 2),
+            "db_queries": round(h.get("db_queries", 0) / n, 2),
+            "openai_ms": round(h.get("openai_seconds", 0) / n * 1000, 2),
+        }
+    return {
+        "event": "metrics", "interval_s": interval,
+        "updates": sum(h["n"] for h in handlers.values()),
+        "handlers": handlers,
+        "db": _delta(cur["db"], prev.get("db", {})),
+        "openai": _delta(cur["openai"], prev.get("openai", {})),
+        "gauges": cur["gauges"],
+    }
+
+
+async def report_periodically(interval: float):
+    """Раз в interval секунд — одна JSON-строка с приращениями метрик (только если были апдейты)."""
+    prev: dict = {}
+    last = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        cur, now = snapshot(), time.monotonic()
+        report = interval_report(cur, prev, round(now - last, 1))
+        prev, last = cur, now
+        if report["updates"] or report["openai"]:
+            logger.info(json.dumps(report, ensure_ascii=False))
@@ -1,162 +1,426 @@
-import json
-from openai import OpenAI
-from config import OPENAI_API_KEY, OPENAI_MODEL
+import time
+import asyncio
+import logging
+from collections import Counter
+from functools import lru_cache, partial
+from typing import Awaitable, Callable
+from openai import (
+    OpenAI, AsyncOpenAI, BadRequestError, APIConnectionError, RateLimitError, InternalServerError,
+)
+from config import (
+    OPENAI_API_KEY, OPENAI_MODEL, OPENAI_TIMEOUT, OPENAI_MAX_CONCURRENCY, OPENAI_PAYLOAD_FORMAT,
+    OPENAI_RESPONSE_FORMAT, OPENAI_ATTEMPT_TIMEOUT, OPENAI_RETRIES, OPENAI_BACKOFF_BASE, OPENAI_BACKOFF_MAX,
+    OPENAI_CIRCUIT_FAILURES, OPENAI_CIRCUIT_RESET, OPENAI_POOL_SIZE, OPENAI_KEEPALIVE,
+)
 from prompt import PROMPT, PROMPT_YOGA
+from services import llm_cache
+from services.metrics import register_collector, track_openai
+from services.payload_codec import encode_payload
+from services.plan_parser import NAME, SET, PlanStream, parse_plan
+from services.resilience import CircuitBreaker, CircuitOpenError, call_with_retry
+from utils.prompt_key import prompt_hash as _prompt_hash
+from utils.logging_setup import Truncated, sampled
+
+logger = logging.getLogger(__name__)
+
+# ограничение одновременных запросов к OpenAI из event loop'а
+_OPENAI_SLOTS = asyncio.Semaphore(max(1, OPENAI_MAX_CONCURRENCY))
+
+# сбои «на той стороне» (сеть, 429, 5xx, таймаут попытки): их повторяем и считаем в breaker;
+# неверный запрос/ключ повтором не лечится
+_RETRYABLE = (APIConnectionError, RateLimitError, InternalServerError, asyncio.TimeoutError)
+# OpenAI недоступен (после повторов или цепь разомкнута) — повод отдать локальный план
+UPSTREAM_ERRORS = _RETRYABLE + (CircuitOpenError,)
+OPENAI_BREAKER = CircuitBreaker("openai", failures=OPENAI_CIRCUIT_FAILURES, reset_after=OPENAI_CIRCUIT_RESET)
+
+# structured outputs: ответ строго {"items": [{name, set, weight, reps}, ...]};
+# короткие ASCII-ключи plan_parser сводит к каноническим «Название упражнения»/…
+PLAN_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["items"],
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["name", "set", "weight", "reps"],
+                "properties": {
+                    "name": {"type": "string", "description": "Название упражнения"},
+                    "set": {"type": "integer", "description": "Номер подхода, с 1"},
+                    "weight": {"type": ["number", "null"], "description": "Вес, кг (одной гантели); null — без веса"},
+                    "reps": {"type": "integer", "description": "Количество повторений (секунд — для поз)"},
+                },
+            },
+        },
+    },
+}
+_RESPONSE_FORMAT = {"type": "json_schema", "json_schema": {"name": "workout_plan", "strict": True, "schema": PLAN_SCHEMA}}
+# модели, отвергшие response_format: до рестарта спрашиваем их текстом
+_schema_rejected: set[str] = set()
+
+# один клиент (и пул HTTP-соединений) на процесс: keep-alive к api.openai.com переживает
+# запросы, TLS-рукопожатие платится один раз, а не на каждый план
+_client: OpenAI | None = None
+_async_client: AsyncOpenAI | None = None
+# requests — HTTP-запросов, connects — новых TCP-соединений, tls — TLS-рукопожатий
+conn_stats = {"requests": 0, "connects": 0, "tls": 0}
+
+
+def _on_trace_event(name: str):
+    if name == "connection.connect_tcp.complete":
+        conn_stats["connects"] += 1
+    elif name == "connection.start_tls.complete":
+        conn_stats["tls"] += 1
+
+
+def _http_client_kwargs(is_async: bool) -> dict:
+    """http_client с лимитами пула и счётчиками соединений; без httpx — дефолт SDK."""
+    try:
+        import httpx
+        from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+    except ImportError:
+        return {}
+    limits = httpx.Limits(max_connections=OPENAI_POOL_SIZE, max_keepalive_connections=OPENAI_POOL_SIZE,
+                          keepalive_expiry=OPENAI_KEEPALIVE)
+    # trace — расширение httpcore: события установки соединений видны без лазания в пул
+    if is_async:
+        async def trace(name, info):
+            _on_trace_event(name)
+
+        async def on_request(request):
+            conn_stats["requests"] += 1
+            request.extensions["trace"] = trace
+        return {"http_client": DefaultAsyncHttpxClient(limits=limits, event_hooks={"request": [on_request]})}
+
+    def on_request_sync(request):
+        conn_stats["requests"] += 1
+        request.extensions["trace"] = lambda name, info: _on_trace_event(name)
+    return {"http_client": DefaultHttpxClient(limits=limits, event_hooks={"request": [on_request_sync]})}
+
 
 def get_openai_client() -> OpenAI | None:
+    global _client
+    if not OPENAI_API_KEY:
+        return None
+    if _client is None:
+        _client = OpenAI(api_key=OPENAI_API_KEY, **_http_client_kwargs(is_async=False))
+    return _client
+
+def get_async_openai_client() -> AsyncOpenAI | None:
+    global _async_client
     if not OPENAI_API_KEY:
         return None
-    return OpenAI(api_key=OPENAI_API_KEY)
+    if _async_client is None:
+        # повторы делает _with_retries (с breaker'ом и общим дедлайном), не SDK
+        _async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_ATTEMPT_TIMEOUT, max_retries=0,
+                                    **_http_client_kwargs(is_async=True))
+    return _async_client
+
+async def close_openai_clients():
+    """Закрыть пулы соединений (shutdown диспетчера); следующий вызов создаст клиентов заново."""
+    global _client, _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def _conn_metrics():
+    reused = conn_stats["requests"] - conn_stats["connects"]
+    return [(f"trainer_openai_http_{k}_total", {}, v) for k, v in conn_stats.items()] + [
+        ("trainer_openai_http_reuse_ratio", {}, reused / conn_stats["requests"] if conn_stats["requests"] else 0.0),
+    ]
+
+
+register_collector(_conn_metrics)
+
+# ключи режима в payload (в «пользователь» и в корне) и алиасы значений
+_MODE_KEYS = ("режим", "Режим", "training_type", "training_mode", "mode")
+STRENGTH_ALIASES = frozenset({"силовая", "силовые", "силовые тренировки", "power", "strength"})
+YOGA_ALIASES = frozenset({"йога", "пилатес", "йога/пилатес", "yoga", "pilates", "yoga/pilates"})
+# отпечатки шаблонов: пользователь, сохранивший шаблон как свой промпт, получает шаблон по режиму
+_TEMPLATE_HASHES = frozenset({_prompt_hash(PROMPT), _prompt_hash(PROMPT_YOGA)})
+
 
 def _detect_mode(payload: dict) -> str | None:
     """
     Возвращает режим из payload, если он есть. Ищет в:
     - payload["пользователь"]
     - корне payload
-    Поддерживает ключи: 'режим', 'Режим', 'training_type', 'training_mode', 'mode'
+    Поддерживает ключи _MODE_KEYS.
     """
-    try:
-        # источники для поиска
-        sources = []
-        sources.append((payload or {}).get("пользователь") or {})
-        sources.append(payload or {})
-        # перебираем ключи
-        for src in sources:
-            for k in ("режим", "Режим", "training_type", "training_mode", "mode"):
-                if k in src and src[k]:
-                    return str(src[k]).strip().lower()
-    except Exception:
-        pass
+    payload = payload or {}
+    for src in (payload.get("пользователь") or {}, payload):
+        for k in _MODE_KEYS:
+            if src.get(k):
+                return str(src[k]).strip().lower()
+    return None
+
+
+def _normalize_mode(mode: str | None) -> str | None:
+    """yoga | strength | None (неизвестный режим ведёт себя как силовой)."""
+    if mode in YOGA_ALIASES:
+        return "yoga"
+    if mode in STRENGTH_ALIASES:
+        return "strength"
     return None
 
 
-# Helper: Проверка на пустой промпт
-def _is_empty_prompt(p) -> bool:
-    """Возвращает True, если промпт отсутствует или является маркером пустого значения.
-    Принимаем как пустые: None, "", "none", "null", "nil", "default", "/default", "auto" (в любом регистре).
+@lru_cache(maxsize=1024)
+def _template_for(user_prompt_hash: str | None, mode: str | None) -> str | None:
     """
-    if p is None:
-        return True
-    try:
-        s = str(p).strip()
-    except Exception:
-        return True
-    if not s:
-        return True
-    if s.lower() in {"none", "null", "nil", "default", "/default", "auto"}:
-        return True
-    return False
+    Шаблон по (отпечаток промпта, нормализованный режим) или None — промпт кастомный, отдаём как есть.
+    Пустой промпт и промпт, равный одному из шаблонов, выбираются по режиму.
+    """
+    if user_prompt_hash is None or user_prompt_hash in _TEMPLATE_HASHES:
+        return PROMPT_YOGA if mode == "yoga" else PROMPT
+    return None
+
 
-def _resolve_prompt(payload: dict, user_prompt: str | None) -> str:
+def _resolve_prompt(payload: dict, user_prompt: str | None, user_prompt_hash: str | None = None) -> str:
     """
     Возвращает итоговый промпт: приоритет user_prompt, но:
     - если user_prompt пустой/маркер пустоты -> берём по режиму
     - если user_prompt равен одному из дефолтных шаблонов (PROMPT или PROMPT_YOGA),
       считаем это "дефолтным" и подменяем согласно текущему режиму.
+    user_prompt_hash — готовый users.prompt_hash, чтобы не хешировать промпт на каждый запрос.
     """
-    # 0) Отладка входных параметров
-    try:
-        print(f"[PROMPT] _resolve_prompt: user_prompt={'EMPTY' if _is_empty_prompt(user_prompt) else 'SET'}")
-    except Exception:
-        pass
-
-    # 1) Нормализация набора алиасов режима
-    power_aliases = {"силовая", "силовые", "силовые тренировки", "power", "strength"}
-    yoga_aliases = {"йога", "пилатес", "йога/пилатес", "yoga", "pilates", "yoga/pilates"}
-
-    # 2) Если пользователь явно задал свой промпт
-    if not _is_empty_prompt(user_prompt):
-        up = str(user_prompt).strip()
-
-        # Если пользовательский промпт фактически равен одному из дефолтных шаблонов,
-        # трактуем его как "дефолт" и выбираем по текущему режиму.
-        if up == PROMPT or up == PROMPT_YOGA:
-            mode_dbg = _detect_mode(payload)
-            try:
-                print(f"[PROMPT] Кастомный промпт совпадает с дефолтным шаблоном. Режим='{mode_dbg}'. Выбираю по режиму.")
-            except Exception:
-                pass
-            if mode_dbg in yoga_aliases:
-                return PROMPT_YOGA
-            # силовой по умолчанию
-            return PROMPT
-
-        # Иначе это реально кастом — отдаём как есть
+    phash = user_prompt_hash if user_prompt_hash is not None else _prompt_hash(user_prompt)
+    mode = _normalize_mode(_detect_mode(payload))
+    template = _template_for(phash, mode)
+    if logger.isEnabledFor(logging.DEBUG):
+        chosen = "CUSTOM" if template is None else "YOGA" if template is PROMPT_YOGA else "STRENGTH"
+        logger.debug("_resolve_prompt: user_prompt=%s, режим=%r → %s", "EMPTY" if phash is None else "SET", mode, chosen)
+    return template if template is not None else str(user_prompt).strip()
+
+def _structured() -> bool:
+    return OPENAI_RESPONSE_FORMAT == "json_schema" and OPENAI_MODEL not in _schema_rejected
+
+
+def _rejects_schema(e: BadRequestError) -> bool:
+    msg = str(e)
+    return "response_format" in msg or "json_schema" in msg
+
+
+def _on_schema_rejected(e: BadRequestError):
+    _schema_rejected.add(OPENAI_MODEL)
+    logger.warning("OpenAI: модель %s не принимает response_format (%s) — дальше текстовый режим", OPENAI_MODEL, e)
+
+
+def _build_messages(payload: dict, prompt: str, fmt: str = OPENAI_PAYLOAD_FORMAT,
+                    structured: bool = False, prompt_hash: str | None = None) -> list[dict]:
+    """
+    Собирает messages для chat.completions: резолвит промпт и упаковывает payload в формате fmt.
+    structured — формат ответа задаёт PLAN_SCHEMA, описывать поля текстом не нужно.
+    """
+    final_prompt = _resolve_prompt(payload, prompt, prompt_hash)
+
+    intro, data = encode_payload(payload, fmt)
+    answer = (
+        "Ответ — по элементу items на каждый подход. " if structured else
+        "Ответ присылай в чистом json без пояснений и лишних слов, сухая информация. Поля - Название упражнения, Номер подхода, Вес, Количество повторений"
+    )
+    content = (
+        intro
+        + answer
+        + "Используй мой промпт после данных.\n\n"
+        + data
+        + "\n\nПромпт:\n"
+        + final_prompt
+    )
+    return [
+        {"role": "system", "content": "Ты умный тренер-ассистент. Отвечай кратко и по делу."},
+        {"role": "user", "content": content},
+    ]
+
+async def _create(client: AsyncOpenAI, messages: list[dict], text_messages: Callable[[], list[dict]],
+                  structured: bool, **kwargs):
+    """chat.completions.create: structured — с PLAN_SCHEMA, а если модель её не принимает — текстом (text_messages())."""
+    if structured:
         try:
-            mode_dbg = _detect_mode(payload)
-            print(f"[PROMPT] Использую реальный кастомный user_prompt. Обнаруженный режим='{mode_dbg}' (игнорируется).")
-        except Exception:
-            pass
-        return up
+            return await client.chat.completions.create(model=OPENAI_MODEL, messages=messages,
+                                                        response_format=_RESPONSE_FORMAT, **kwargs)
+        except BadRequestError as e:
+            if not _rejects_schema(e):
+                raise
+            _on_schema_rejected(e)
+            messages = text_messages()
+    return await client.chat.completions.create(model=OPENAI_MODEL, messages=messages, **kwargs)
 
-    # 3) user_prompt пуст — определяем режим
-    mode = _detect_mode(payload)
+async def _with_retries(attempt: Callable[[AsyncOpenAI], Awaitable[str]],
+                        can_retry: Callable[[], bool] = lambda: True) -> str:
+    """
+    attempt(client) под слотом _OPENAI_SLOTS: до 1 + OPENAI_RETRIES попыток по OPENAI_ATTEMPT_TIMEOUT
+    с backoff'ом, пока не вышел OPENAI_TIMEOUT от начала. Разомкнутый OPENAI_BREAKER — сразу
+    CircuitOpenError, без ожидания слота.
+    """
+    if OPENAI_BREAKER.state == "open":
+        OPENAI_BREAKER.before_call()
+    deadline = time.monotonic() + OPENAI_TIMEOUT
+    client = get_async_openai_client()
 
-    # 4) Выбор промпта по режиму
-    if mode in yoga_aliases:
+    async def timed() -> str:
+        t0 = time.perf_counter()
         try:
-            print(f"[PROMPT] Режим детектирован как 'yoga/pilates' ('{mode}') → выбираю PROMPT_YOGA.")
-        except Exception:
-            pass
-        return PROMPT_YOGA
+            text = await asyncio.wait_for(attempt(client), OPENAI_ATTEMPT_TIMEOUT)
+        except BaseException:
+            track_openai(time.perf_counter() - t0, error=True)
+            raise
+        track_openai(time.perf_counter() - t0)
+        return text
 
-    try:
-        print(f"[PROMPT] Режим детектирован как 'силовой' ('{mode}') или отсутствует → выбираю базовый PROMPT.")
-    except Exception:
-        pass
-    return PROMPT
+    async with _OPENAI_SLOTS:
+        return await call_with_retry(timed, breaker=OPENAI_BREAKER, attempts=1 + OPENAI_RETRIES,
+                                     base_delay=OPENAI_BACKOFF_BASE, max_delay=OPENAI_BACKOFF_MAX,
+                                     deadline=deadline, retry_on=_RETRYABLE, can_retry=can_retry)
 
-def ask_openai(payload: dict, prompt: str) -> tuple[str, list[dict]]:
+def _log_response(text: str, items: list):
+    logger.info("OpenAI: ответ %d символов, %d пунктов плана", len(text), len(items))
+    # полный текст — только на DEBUG и только для доли ответов
+    if logger.isEnabledFor(logging.DEBUG) and sampled():
+        logger.debug("OpenAI raw response: %s", Truncated(text))
+
+def ask_openai(payload: dict, prompt: str, prompt_hash: str | None = None) -> tuple[str, list[dict]]:
     """
     Возвращает (raw_text, items_list). items_list — это распарсенный JSON-массив с планом.
+    Синхронная версия: блокирует поток, из хендлеров используй ask_openai_async.
     """
     client = get_openai_client()
     if not client:
         return "[OpenAI] ERROR: OPENAI_API_KEY is not set", []
 
-    final_prompt = _resolve_prompt(payload, prompt)
-
+    structured = _structured()
+    messages = _build_messages(payload, prompt, structured=structured, prompt_hash=prompt_hash)
+    t0 = time.perf_counter()
     try:
-        detected_mode = _detect_mode(payload)
-        if final_prompt == PROMPT_YOGA:
-            chosen = "YOGA"
-        elif final_prompt == PROMPT:
-            chosen = "STRENGTH"
-        else:
-            chosen = "CUSTOM"
-        print(f"[PROMPT] Детектированный режим='{detected_mode}' → выбран промпт: {chosen}")
+        try:
+            extra = {"response_format": _RESPONSE_FORMAT} if structured else {}
+            resp = client.chat.completions.create(model=OPENAI_MODEL, messages=messages, timeout=OPENAI_TIMEOUT, **extra)
+        except BadRequestError as e:
+            if not structured or not _rejects_schema(e):
+                raise
+            _on_schema_rejected(e)
+            resp = client.chat.completions.create(
+                model=OPENAI_MODEL, messages=_build_messages(payload, prompt, prompt_hash=prompt_hash), timeout=OPENAI_TIMEOUT)
     except Exception:
-        pass
+        track_openai(time.perf_counter() - t0, error=True)
+        raise
+    track_openai(time.perf_counter() - t0)
+    text = resp.choices[0].message.content if resp and resp.choices else "(пустой ответ)"
+    items = parse_plan(text)
+    _log_response(text, items)
+    return text, items
 
-    if _is_empty_prompt(final_prompt):
-        # Резерв: если по какой-то причине пришёл пустой промпт — используем силовой по умолчанию
-        final_prompt = PROMPT
+async def ask_openai_async(payload: dict, prompt: str, refresh: bool = False,
+                           prompt_hash: str | None = None) -> tuple[str, list[dict]]:
+    """
+    Асинхронный аналог ask_openai: не блокирует event loop.
+    - одинаковые запросы (модель + промпт + payload) берутся из кеша llm_cache,
+      одновременные одинаковые — склеиваются в один вызов API;
+    - одновременно выполняется не больше OPENAI_MAX_CONCURRENCY запросов;
+    - весь запрос (включая ожидание слота) ограничен OPENAI_TIMEOUT -> asyncio.TimeoutError;
+    - сетевые сбои, 429 и 5xx повторяются с backoff'ом (services.resilience); после серии сбоев
+      цепь размыкается и вызовы сразу падают CircuitOpenError — хендлер отдаёт локальный план;
+    - отмена задачи хендлера прерывает HTTP-запрос и освобождает слот;
+    - refresh=True — мимо кеша (явная перегенерация плана);
+    - prompt_hash — users.prompt_hash для prompt, если он уже известен;
+    - OPENAI_RESPONSE_FORMAT=json_schema — ответ по PLAN_SCHEMA (structured outputs), если модель
+      его не поддерживает — прежний текстовый режим.
+    """
+    if not OPENAI_API_KEY:
+        return "[OpenAI] ERROR: OPENAI_API_KEY is not set", []
 
-    content = (
-        "Ниже данные пользователя и история за 30 дней в формате JSON (на русском). "
-        "Ответ присылай в чистом json без пояснений и лишних слов, сухая информация. Поля - Название упражнения, Номер подхода, Вес, Количество повторений"
-        "Используй мой промпт после данных.\n\n"
-        + json.dumps(payload, ensure_ascii=False, indent=2)
-        + "\n\nПромпт:\n"
-        + final_prompt
-    )
+    structured = _structured()
+    messages = _build_messages(payload, prompt, structured=structured, prompt_hash=prompt_hash)
+    text_messages = partial(_build_messages, payload, prompt, prompt_hash=prompt_hash)  # если модель отвергнет схему
 
-    resp = client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": "Ты умный тренер-ассистент. Отвечай кратко и по делу."},
-            {"role": "user", "content": content},
-        ],
-    )
-    text = resp.choices[0].message.content if resp and resp.choices else "(пустой ответ)"
-    print(text)
-    items = []
-    try:
-        s, e = text.find('['), text.rfind(']')
-        if s != -1 and e != -1 and e > s:
-            items = json.loads(text[s:e+1])
+    async def _attempt(client: AsyncOpenAI) -> str:
+        resp = await _create(client, messages, text_messages, structured)
+        return resp.choices[0].message.content if resp and resp.choices else "(пустой ответ)"
+
+    async def _call() -> str:
+        return await _with_retries(_attempt)
+
+    return await _cached_request(messages, _call, refresh)
+
+
+async def ask_openai_stream(payload: dict, prompt: str,
+                            on_item: Callable[[dict], Awaitable[None]], refresh: bool = False,
+                            prompt_hash: str | None = None) -> tuple[str, list[dict]]:
+    """
+    Как ask_openai_async, но ответ читается потоком (stream=True): on_item(item) вызывается
+    для каждого пункта плана, как только он пришёл целиком, — первый пункт виден через
+    время до первых токенов, а не через всю генерацию. Ответ из кеша (или чужого такого же
+    запроса в полёте) отдаётся в on_item разом. Возвращает (raw_text, items) как ask_openai_async.
+    """
+    if not OPENAI_API_KEY:
+        return "[OpenAI] ERROR: OPENAI_API_KEY is not set", []
+
+    structured = _structured()
+    messages = _build_messages(payload, prompt, structured=structured, prompt_hash=prompt_hash)
+    text_messages = partial(_build_messages, payload, prompt, prompt_hash=prompt_hash)  # если модель отвергнет схему
+    streamed = 0
+    sent: Counter = Counter()   # (упражнение, подход) уже отданных в on_item
+
+    async def _attempt(client: AsyncOpenAI) -> str:
+        nonlocal streamed
+        parser, parts = PlanStream(), []
+        t0 = time.perf_counter()
+        stream = await _create(client, messages, text_messages, structured, stream=True)
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            parts.append(delta)
+            for item in parser.feed(delta):
+                if not streamed:
+                    logger.info("OpenAI stream: первый пункт плана через %.2fs", time.perf_counter() - t0)
+                streamed += 1
+                sent[_item_key(item)] += 1
+                await on_item(item)
+        return "".join(parts) or "(пустой ответ)"
+
+    async def _call() -> str:
+        # повтор после того, как пункты уже ушли в on_item, задвоил бы план
+        return await _with_retries(_attempt, can_retry=lambda: streamed == 0)
+
+    text, items = await _cached_request(messages, _call, refresh)
+    # кеш/склеенный запрос (потока не было) или итоговый разбор нашёл то, что потоковый пропустил:
+    # досылаем только пункты, которых on_item ещё не видел, — сверка по упражнению и подходу, не по позиции
+    for item in items:
+        key = _item_key(item)
+        if sent[key]:
+            sent[key] -= 1
         else:
-            items = json.loads(text)
-    except Exception:
-        items = []
-    return text, items
\ No newline at end of file
+            await on_item(item)
+    return text, items
+
+
+def _item_key(item: dict) -> tuple:
+    return str(item.get(NAME) or "").strip().lower(), item.get(SET)
+
+
+async def _cached_request(messages: list[dict], call: Callable[[], Awaitable[str]],
+                          refresh: bool = False) -> tuple[str, list[dict]]:
+    parsed: dict[str, list[dict]] = {}
+
+    def items_of(text: str) -> list[dict]:
+        if text not in parsed:
+            parsed[text] = parse_plan(text)
+        return parsed[text]
+
+    text, cached = await asyncio.wait_for(
+        llm_cache.cached_call(llm_cache.cache_key(OPENAI_MODEL, messages), OPENAI_MODEL, call,
+                              cacheable=lambda t: bool(items_of(t)), refresh=refresh),
+        timeout=OPENAI_TIMEOUT,
+    )
+    items = items_of(text)
+    if cached:
+        logger.info("OpenAI: ответ из кеша, %d пунктов плана", len(items))
+    else:
+        _log_response(text, items)
+    return text, items
@@ -0,0 +1,91 @@
+"""
+Упаковка payload планировщика в текст для LLM.
+
+Форматы (OPENAI_PAYLOAD_FORMAT):
+- json    — прежний json.dumps(indent=2), по умолчанию: ключи вроде «выполненные_повторения»
+            на каждой строке истории;
+- compact — тот же JSON без отступов и пустых полей;
+- table   — профиль и анкета строкой «ключ=значение», история — по строке на упражнение
+            в тренировке, подходы свёрнуты в «вес×цель/факт».
+
+Сравнить размер и латентность форматов: python bench/payload_bench.py
+"""
+import json
+
+FORMATS = ("json", "compact", "table")
+
+_INTRO_JSON = "Ниже данные пользователя и история за 30 дней в формате JSON (на русском). "
+_INTRO_TABLE = (
+    "Ниже данные пользователя и история за 30 дней в компактном виде (на русском). "
+    "История: строка на упражнение в тренировке, подходы по порядку как вес×целевые/выполненные повторы, "
+    "«?» — повторы не внесены, без веса — упражнение без отягощения. "
+)
+
+
+def _fmt_num(v) -> str:
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return "?" if v is None else str(v)
+
+
+def _kv_line(title: str, d: dict | None) -> str:
+    parts = [f"{k}={_fmt_num(v)}" for k, v in (d or {}).items() if v not in (None, "")]
+    return f"{title}: {'; '.join(parts) if parts else '—'}"
+
+
+def _set_cell(row: dict) -> str:
+    reps = f"{_fmt_num(row.get('целевые_повторения'))}/{_fmt_num(row.get('выполненные_повторения'))}"
+    weight = row.get("вес")
+    return f"{_fmt_num(weight)}×{reps}" if weight else reps
+
+
+def _by_workout(history):
+    """
+    (номер тренировки, строка). id тренировки в payload нет, но repository отдаёт историю
+    по (дата, тренировка, подход): строки одной тренировки идут подряд с неубывающим номером
+    подхода. Новая тренировка — смена даты, откат номера подхода или повтор (упражнение, подход).
+    """
+    workout, prev_date, prev_set, seen = 0, None, None, set()
+    for row in history:
+        d, s, key = row.get("дата"), row.get("подход") or 0, (row.get("упражнение"), row.get("подход"))
+        if d != prev_date or (prev_set is not None and s < prev_set) or key in seen:
+            workout += 1
+            seen.clear()
+        prev_date, prev_set = d, s
+        seen.add(key)
+        yield workout, row
+
+
+def encode_table(payload: dict) -> str:
+    lines = [
+        _kv_line("Профиль", payload.get("пользователь")),
+        f"Режим: {payload.get('режим') or '—'}",
+        _kv_line("Анкета", payload.get("анкета")),
+    ]
+    # (тренировка, дата, упражнение) -> [(подход, ячейка)], порядок первого появления сохраняется
+    groups: dict[tuple, list] = {}
+    for workout, row in _by_workout(payload.get("история") or ()):
+        groups.setdefault((workout, row.get("дата"), row.get("упражнение")), []).append(
+            (row.get("подход") or 0, _set_cell(row)))
+    lines.append("История (дата | упражнение | подходы):" if groups else "История: пусто")
+    for (_, d, name), sets in groups.items():
+        sets.sort(key=lambda s: s[0])
+        lines.append(f"{d} | {name} | {' '.join(cell for _, cell in sets)}")
+    return "\n".join(lines)
+
+
+def _drop_empty(obj):
+    if isinstance(obj, dict):
+        return {k: _drop_empty(v) for k, v in obj.items() if v is not None}
+    if isinstance(obj, list):
+        return [_drop_empty(v) for v in obj]
+    return obj
+
+
+def encode_payload(payload: dict, fmt: str = "json") -> tuple[str, str]:
+    """(вводная фраза про формат, данные) для user-сообщения. Неизвестный fmt — как json."""
+    if fmt == "table":
+        return _INTRO_TABLE, encode_table(payload)
+    if fmt == "compact":
+        return _INTRO_JSON, json.dumps(_drop_empty(payload), ensure_ascii=False, separators=(",", ":"))
+    return _INTRO_JSON, json.dumps(payload, ensure_ascii=False, indent=2)
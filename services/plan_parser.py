@@ -0,0 +1,84 @@
+"""
+Пункты плана из ответа LLM → канонический вид для repository.plan_rows:
+{"Название упражнения", "Номер подхода", "Вес", "Количество повторений"}.
+
+Модель не всегда держит формат: ключи приходят по-английски или в другом написании
+(«name», «упражнение», «weight_kg», «повторы»), числа — строками («50 кг», «8-10»),
+а вместо подхода на строку — упражнение с числом подходов («sets»: 4). Всё это приводим
+к одной форме, чтобы оплаченный ответ не выбрасывался из-за написания.
+"""
+import logging
+import re
+
+from utils.json_stream import JsonArrayStream, extract_objects
+
+logger = logging.getLogger(__name__)
+
+NAME, SET, WEIGHT, REPS = "Название упражнения", "Номер подхода", "Вес", "Количество повторений"
+_SETS_COUNT = "sets_count"
+
+# нормализованный ключ (нижний регистр, без «_-.» и пробелов) -> канонический
+_ALIASES = {
+    NAME: ("название упражнения", "название", "упражнение", "name", "exercise", "exercise name", "title"),
+    SET: ("номер подхода", "подход", "set", "set number", "set index", "set no"),
+    WEIGHT: ("вес", "вес кг", "weight", "weight kg", "kg"),
+    REPS: ("количество повторений", "повторения", "повторы", "повторений", "reps", "repetitions",
+           "target reps", "целевые повторения"),
+    _SETS_COUNT: ("подходы", "подходов", "количество подходов", "sets", "sets count", "number of sets"),
+}
+
+
+def _norm_key(key: str) -> str:
+    return " ".join(re.sub(r"[_\-.]+", " ", str(key)).lower().split())
+
+
+_KEY_MAP = {_norm_key(alias): canon for canon, aliases in _ALIASES.items() for alias in aliases}
+_NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def _number(value):
+    """50 / "50" / "50 кг" / "8-10" / "42,5" → число (у диапазона — нижняя граница); иначе как есть."""
+    if isinstance(value, str):
+        m = _NUMBER.search(value)
+        if not m:
+            return None if not value.strip() else value
+        num = float(m.group().replace(",", "."))
+        return int(num) if num.is_integer() else num
+    return value
+
+
+def normalize_item(obj) -> list[dict]:
+    """Один объект ответа → 0..N канонических пунктов (N > 1, если пришло «sets»: N без номера подхода)."""
+    if not isinstance(obj, dict):
+        return []
+    item = {}
+    for key, value in obj.items():
+        canon = _KEY_MAP.get(_norm_key(key))
+        if canon and canon not in item:
+            item[canon] = value if canon == NAME else _number(value)
+    if not item.get(NAME):
+        return []
+    count = item.pop(_SETS_COUNT, None)
+    if item.get(SET) is None and isinstance(count, (int, float)) and 0 < count <= 20:
+        return [{**item, SET: i} for i in range(1, int(count) + 1)]
+    return [item]
+
+
+def parse_plan(text: str) -> list[dict]:
+    """Пункты плана из всего текста ответа: терпимо к прозе, висячим запятым и оборванному хвосту."""
+    objects, clean = extract_objects(text or "")
+    items = [it for obj in objects for it in normalize_item(obj)]
+    if not clean:
+        logger.warning("Ответ LLM разобран с восстановлением: %d объектов → %d пунктов плана", len(objects), len(items))
+    return items
+
+
+class PlanStream:
+    """Потоковый вариант parse_plan: feed(chunk) → новые канонические пункты."""
+    __slots__ = ("_parser",)
+
+    def __init__(self):
+        self._parser = JsonArrayStream()
+
+    def feed(self, chunk: str) -> list[dict]:
+        return [it for obj in self._parser.feed(chunk) for it in normalize_item(obj)]
@@ -0,0 +1,141 @@
+"""
+Где выполняется local_planer.generate_plan: PLANNER_EXECUTOR = inline | process.
+
+inline — прямо в event loop'е (как раньше, по умолчанию): на обычных историях это
+миллисекунды. process — в пуле из PLANNER_POOL_SIZE процессов: длинные истории не
+держат loop, а планы для разных пользователей считаются на разных ядрах.
+
+В процесс уходит упакованный payload (pack_payload): история — кортежи по столбцам
+вместо словарей с повторяющимися русскими ключами, пустые поля профиля отброшены.
+Воркеры запускаются заранее (start_planner_pool на startup) и при старте один раз
+прогоняют планировщик — первый пользователь не платит за spawn и импорты.
+Если пул сломался (воркер убит OOM-killer'ом и т. п.), план считается inline,
+а пул пересоздаётся при следующем вызове.
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import PLANNER_EXECUTOR, PLANNER_POOL_SIZE
+from services.local_planer import generate_plan
+from services.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+_pool: ProcessPoolExecutor | None = None
+_stats = {"inline": 0, "process": 0, "fallback": 0}
+_seconds = {"inline": 0.0, "process": 0.0}
+
+
+# --- упаковка payload --------------------------------------------------------
+
+def pack_payload(payload: dict) -> tuple:
+    """
+    payload → компактный кортеж для передачи в воркер (и обратно — unpack_payload).
+    Строки истории с одинаковым набором ключей — кортежи значений; прочие остаются dict.
+    """
+    history = payload.get("история") or []
+    columns = tuple(history[0]) if history and isinstance(history[0], dict) else ()
+    rows = [tuple(r.values()) if isinstance(r, dict) and tuple(r) == columns else r for r in history]
+    user = {k: v for k, v in (payload.get("пользователь") or {}).items() if v is not None}
+    anketa = {k: v for k, v in (payload.get("анкета") or {}).items() if v is not None}
+    return payload.get("режим"), user, anketa, columns, rows
+
+
+def unpack_payload(packed: tuple) -> dict:
+    mode, user, anketa, columns, rows = packed
+    history = [dict(zip(columns, r)) if isinstance(r, tuple) else r for r in rows]
+    return {"пользователь": user, "история": history, "режим": mode, "анкета": anketa}
+
+
+# --- воркер ------------------------------------------------------------------
+
+_WARMUP_PAYLOAD = pack_payload({"режим": "strength", "пользователь": {"Вес": 80}, "история": [], "анкета": {}})
+
+
+def _warm_worker():
+    # initializer пула: импорты уже выполнены, прогоняем планировщик один раз (lru_cache каталога и т. п.)
+    generate_plan(unpack_payload(_WARMUP_PAYLOAD))
+
+
+def _ping() -> int:
+    return 0
+
+
+def _plan_packed(packed: tuple) -> list[dict]:
+    return generate_plan(unpack_payload(packed))
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, а не fork: в родителе уже работают потоки (SQLite-executor, HTTP-клиенты)
+        _pool = ProcessPoolExecutor(max_workers=max(1, PLANNER_POOL_SIZE),
+                                    mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_warm_worker)
+    return _pool
+
+
+# --- API ---------------------------------------------------------------------
+
+async def start_planner_pool():
+    """Startup: поднять все воркеры пула заранее (в режиме inline ничего не делает)."""
+    global _pool
+    if PLANNER_EXECUTOR != "process":
+        return
+    t0 = time.perf_counter()
+    pool = _get_pool()
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(*(loop.run_in_executor(pool, _ping) for _ in range(max(1, PLANNER_POOL_SIZE))))
+    except BrokenProcessPool:
+        # бот всё равно стартует: plan_async попробует пул заново, а при сбое посчитает inline
+        logger.exception("Пул планировщика не поднялся")
+        _pool = None
+        return
+    logger.info("Пул планировщика: %d процессов готовы за %.1fs", PLANNER_POOL_SIZE, time.perf_counter() - t0)
+
+
+async def close_planner_pool():
+    """Shutdown: остановить воркеры, не дожидаясь невыполненных задач."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def plan_async(payload: dict) -> list[dict]:
+    """generate_plan(payload) в настроенном исполнителе."""
+    global _pool
+    t0 = time.perf_counter()
+    if PLANNER_EXECUTOR == "process":
+        try:
+            items = await asyncio.get_running_loop().run_in_executor(_get_pool(), _plan_packed, pack_payload(payload))
+        except BrokenProcessPool:
+            logger.exception("Пул планировщика сломан — план считаем в event loop'е, пул пересоздадим")
+            _stats["fallback"] += 1
+            _pool = None
+        else:
+            _stats["process"] += 1
+            _seconds["process"] += time.perf_counter() - t0
+            return items
+        t0 = time.perf_counter()
+    items = generate_plan(payload)
+    _stats["inline"] += 1
+    _seconds["inline"] += time.perf_counter() - t0
+    return items
+
+
+def _metrics():
+    out = [("trainer_planner_fallback_total", {}, _stats["fallback"])]
+    for where in ("inline", "process"):
+        labels = {"executor": where}
+        out.append(("trainer_planner_plans_total", labels, _stats[where]))
+        out.append(("trainer_planner_seconds_total", labels, _seconds[where]))
+    return out
+
+
+register_collector(_metrics)
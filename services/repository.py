@@ -0,0 +1,432 @@
+"""
+Слой доступа к данным для хендлеров.
+Все функции асинхронные и выполняются в потоке БД (db.get_db()), каждая — одной транзакцией.
+SQL вынесен в константы модуля: sqlite3 кеширует подготовленные выражения по тексту запроса.
+"""
+import hashlib
+import logging
+import sqlite3
+from datetime import date as _date, datetime, timedelta, timezone
+from typing import NamedTuple
+
+from db import get_db
+from utils.logging_setup import LazyJSON
+from utils.prompt_key import prompt_hash
+
+logger = logging.getLogger(__name__)
+
+# --- users -------------------------------------------------------------------
+
+# колонки users, которые можно обновлять из хендлеров
+USER_COLUMNS = {
+    "name", "age", "height", "weight", "goal", "experience", "gender", "training_type", "prompt",
+    "bench_max_kg", "squat_max_kg", "pullups_reps", "deadlift_max_kg", "dips_reps", "ohp_max_kg", "cgbp_max_kg",
+}
+
+_SQL_USER_TYPE = "SELECT id, training_type FROM users WHERE tg_id = ?"
+_SQL_USER_INSERT = "INSERT INTO users (tg_id, name) VALUES (?, ?)"
+_SQL_PROFILE = "SELECT name, age, height, weight, goal, experience, gender FROM users WHERE tg_id = ?"
+_SQL_PROMPT_MODE = "SELECT prompt, training_type FROM users WHERE tg_id = ?"
+_SQL_ONBOARDING = (
+    "SELECT bench_max_kg, cgbp_max_kg, squat_max_kg, pullups_reps, deadlift_max_kg, dips_reps, ohp_max_kg "
+    "FROM users WHERE tg_id = ?"
+)
+
+
+def _update_user(conn: sqlite3.Connection, tg_id: int, fields: dict) -> int:
+    unknown = set(fields) - USER_COLUMNS
+    if unknown:
+        raise ValueError(f"Unknown users columns: {sorted(unknown)}")
+    if "prompt" in fields:
+        # отпечаток для openai_client._resolve_prompt считаем один раз — при сохранении
+        fields = {**fields, "prompt_hash": prompt_hash(fields["prompt"])}
+    set_clause = ", ".join(f"{k} = ?" for k in fields.keys())
+    return conn.execute(f"UPDATE users SET {set_clause} WHERE tg_id = ?", (*fields.values(), tg_id)).rowcount
+
+
+async def ensure_user(tg_id: int, name: str | None) -> str | None:
+    """Создать пользователя, если его нет. Возвращает training_type (None для нового)."""
+    def job(conn):
+        row = conn.execute(_SQL_USER_TYPE, (tg_id,)).fetchone()
+        if not row:
+            conn.execute(_SQL_USER_INSERT, (tg_id, name))
+            return None
+        return row["training_type"]
+    return await get_db().run(job)
+
+
+async def update_user(tg_id: int, **fields) -> int:
+    if not fields:
+        return 0
+    return await get_db().run(_update_user, tg_id, fields)
+
+
+async def get_profile(tg_id: int) -> sqlite3.Row | None:
+    return await get_db().fetchone(_SQL_PROFILE, (tg_id,))
+
+
+async def update_profile(tg_id: int, fields: dict) -> sqlite3.Row | None:
+    """Обновить поля профиля и вернуть свежую карточку — за одно обращение к БД."""
+    def job(conn):
+        _update_user(conn, tg_id, fields)
+        return conn.execute(_SQL_PROFILE, (tg_id,)).fetchone()
+    return await get_db().run(job)
+
+
+async def get_prompt_and_mode(tg_id: int) -> sqlite3.Row | None:
+    return await get_db().fetchone(_SQL_PROMPT_MODE, (tg_id,))
+
+
+async def get_onboarding(tg_id: int) -> sqlite3.Row | None:
+    return await get_db().fetchone(_SQL_ONBOARDING, (tg_id,))
+
+
+# --- history -----------------------------------------------------------------
+
+HISTORY_DAYS = 30
+
+_SQL_PLANNER_USER = """
+    SELECT name, age, height, weight, goal, experience, training_type, prompt, prompt_hash,
+           bench_max_kg, cgbp_max_kg, squat_max_kg, pullups_reps, deadlift_max_kg, dips_reps, ohp_max_kg
+    FROM users WHERE tg_id = ?
+"""
+_SQL_HISTORY = """
+    SELECT w.date AS date, e.name AS exercise, e.set_index AS set_number,
+           e.weight AS weight, e.target_reps AS target_reps, e.actual_reps AS actual_reps
+    FROM workouts w JOIN exercises e ON e.workout_id = w.id
+    WHERE w.tg_id = ? AND w.date >= ?
+    ORDER BY w.date ASC, w.id ASC, e.set_index ASC
+"""
+_SQL_HISTORY_BY_TYPE = """
+    SELECT w.date AS date, e.name AS exercise, e.set_index AS set_number,
+           e.weight AS weight, e.target_reps AS target_reps, e.actual_reps AS actual_reps
+    FROM workouts w JOIN exercises e ON e.workout_id = w.id
+    WHERE w.tg_id = ? AND w.date >= ? AND e.training_type = ?
+    ORDER BY w.date ASC, w.id ASC, e.set_index ASC
+"""
+
+
+def _history(conn, tg_id: int, since: str, mode: str | None) -> list[sqlite3.Row]:
+    if mode:
+        return conn.execute(_SQL_HISTORY_BY_TYPE, (tg_id, since, mode)).fetchall()
+    return conn.execute(_SQL_HISTORY, (tg_id, since)).fetchall()
+
+
+def build_planner_payload(user: sqlite3.Row | dict | None, history: list) -> dict:
+    """
+    Payload для local_planer.generate_plan / ask_openai:
+    {"пользователь": {...}, "история": [...], "режим": ..., "анкета": {...}}.
+    user — строка users (или dict с теми же колонками), history — строки _SQL_HISTORY.
+    """
+    u = dict(user) if user else {}
+    mode_val = u.get("training_type")
+    user_info_ru = {"Имя": u.get("name"), "Возраст": u.get("age"), "Рост": u.get("height"),
+                    "Вес": u.get("weight"), "Цель": u.get("goal"), "Опыт": u.get("experience"),
+                    "Режим": mode_val}
+    history_ru = [{"дата": r["date"], "упражнение": r["exercise"], "подход": r["set_number"],
+                   "вес": r["weight"], "целевые_повторения": r["target_reps"], "выполненные_повторения": r["actual_reps"]}
+                  for r in history]
+    return {
+        "пользователь": user_info_ru,
+        "история": history_ru,
+        "режим": mode_val,
+        "анкета": {
+            "жим_лёжа_макс_кг": u.get("bench_max_kg"),
+            "узкий_жим_лёжа_макс_кг": u.get("cgbp_max_kg"),
+            "присед_макс_кг": u.get("squat_max_kg"),
+            "подтягивания_повторы": u.get("pullups_reps"),
+            "становая_макс_кг": u.get("deadlift_max_kg"),
+            "брусья_повторы": u.get("dips_reps"),
+            "ohp_max_kg": u.get("ohp_max_kg"),
+        },
+    }
+
+
+async def load_planner_payload(tg_id: int, days: int = HISTORY_DAYS) -> tuple[dict, str | None]:
+    """
+    Всё, что нужно планировщикам, за одно обращение к БД: профиль, анкета и промпт
+    одной выборкой из users + история за последние days дней (по покрывающему индексу).
+    Возвращает (payload, user_prompt).
+    """
+    since = (datetime.now(timezone.utc).date() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+    def job(conn):
+        user = conn.execute(_SQL_PLANNER_USER, (tg_id,)).fetchone()
+        mode_val = user["training_type"] if user else None
+        return user, _history(conn, tg_id, since, mode_val)
+    user, history = await get_db().run(job)
+    return build_planner_payload(user, history), (user["prompt"] if user else None)
+
+
+# --- workouts ----------------------------------------------------------------
+
+_SQL_RECENT_WORKOUTS = """
+    SELECT w.id, w.date,
+           (SELECT COUNT(DISTINCT e.name) FROM exercises e WHERE e.workout_id = w.id) AS cnt
+    FROM workouts w
+    WHERE w.tg_id = ?
+    ORDER BY w.date DESC, w.id DESC
+    LIMIT ?
+"""
+_SQL_WORKOUT = "SELECT id, date FROM workouts WHERE id = ? AND tg_id = ?"
+_SQL_WORKOUT_INSERT = "INSERT INTO workouts (tg_id, date, notes, plan_key) VALUES (?, ?, ?, ?)"
+_SQL_PLAN_BY_KEY = "SELECT id FROM workouts WHERE tg_id = ? AND date = ? AND plan_key = ? ORDER BY id DESC LIMIT 1"
+# планы с тем же ключом, по которым ещё не внесено ни одного повтора
+_SQL_UNTOUCHED_PLANS = """
+    SELECT w.id FROM workouts w
+    WHERE w.tg_id = ? AND w.date = ? AND w.plan_key = ?
+      AND NOT EXISTS (SELECT 1 FROM exercises e WHERE e.workout_id = w.id AND e.actual_reps IS NOT NULL)
+"""
+_SQL_EXERCISE_INSERT = """
+    INSERT INTO exercises(workout_id,name,set_index,weight,target_reps,actual_reps,date,training_type)
+    VALUES(?,?,?,?,?,NULL,?,?)
+"""
+_SQL_WORKOUT_SETS = """
+    SELECT name, set_index, weight, target_reps, actual_reps
+    FROM exercises
+    WHERE workout_id = ?
+    ORDER BY name COLLATE NOCASE, set_index ASC
+"""
+_SQL_TODAY_NAMES = """
+    SELECT DISTINCT e.name
+    FROM exercises e JOIN workouts w ON w.id = e.workout_id
+    WHERE w.tg_id = ? AND w.date = ?
+    ORDER BY e.name COLLATE NOCASE
+"""
+_SQL_TODAY_NAMES_BY_TYPE = """
+    SELECT DISTINCT e.name
+    FROM exercises e JOIN workouts w ON w.id = e.workout_id
+    WHERE w.tg_id = ? AND w.date = ? AND e.training_type = ?
+    ORDER BY e.name COLLATE NOCASE
+"""
+_SQL_SETS_BY_WORKOUT = """
+    SELECT e.id, e.set_index, e.weight, e.target_reps, e.actual_reps
+    FROM exercises e JOIN workouts w ON w.id = e.workout_id
+    WHERE e.workout_id = ? AND w.tg_id = ? AND e.name = ?
+    ORDER BY e.set_index ASC
+"""
+_SQL_SETS_BY_DATE = """
+    SELECT e.id, e.set_index, e.weight, e.target_reps, e.actual_reps
+    FROM exercises e JOIN workouts w ON w.id = e.workout_id
+    WHERE w.tg_id = ? AND w.date = ? AND e.name = ?
+    ORDER BY e.set_index ASC
+"""
+_SQL_SET_ACTUAL = "UPDATE exercises SET actual_reps = ? WHERE id = ?"
+_SQL_DELETE_EXERCISES = "DELETE FROM exercises WHERE workout_id = ?"
+_SQL_DELETE_WORKOUT = "DELETE FROM workouts WHERE id = ?"
+
+
+async def list_recent_workouts(tg_id: int, limit: int = 10) -> list[sqlite3.Row]:
+    """Последние тренировки с количеством упражнений (id, date, cnt)."""
+    return await get_db().fetchall(_SQL_RECENT_WORKOUTS, (tg_id, limit))
+
+
+async def get_workout(tg_id: int, workout_id: int) -> sqlite3.Row | None:
+    return await get_db().fetchone(_SQL_WORKOUT, (workout_id, tg_id))
+
+
+async def get_workout_sets(tg_id: int, workout_id: int) -> tuple[sqlite3.Row | None, dict[str, list[sqlite3.Row]]]:
+    """
+    Тренировка и все её подходы, сгруппированные по упражнению:
+    (workout_row | None, {name: [rows...]}) — имена в порядке COLLATE NOCASE.
+    """
+    def job(conn):
+        wrow = conn.execute(_SQL_WORKOUT, (workout_id, tg_id)).fetchone()
+        if not wrow:
+            return None, {}
+        sets: dict[str, list[sqlite3.Row]] = {}
+        for r in conn.execute(_SQL_WORKOUT_SETS, (workout_id,)):
+            sets.setdefault(r["name"], []).append(r)
+        return wrow, sets
+    return await get_db().run(job)
+
+
+# SQLite COLLATE NOCASE сворачивает регистр только у ASCII
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def plan_rows(items: list[dict]) -> list[tuple]:
+    """
+    Провалидировать пункты плана: (name, set_index, weight, target_reps) для каждого корректного
+    пункта, битые пропускаются.
+    """
+    rows = []
+    for item in items:
+        try:
+            name = item.get("Название упражнения"); si = int(item.get("Номер подхода"))
+            weight = item.get("Вес"); weight = int(weight) if weight is not None else None
+            target = item.get("Количество повторений"); target = int(target) if target is not None else None
+            if not name: continue
+            rows.append((name, si, weight, target))
+        except Exception as ex:
+            logger.warning("Пропускаю пункт плана: %s | %s", ex, LazyJSON(item))
+    return rows
+
+
+def plan_names(rows: list[tuple]) -> list[str]:
+    """Уникальные названия упражнений в том же порядке, что ORDER BY name COLLATE NOCASE."""
+    return sorted({r[0] for r in rows}, key=lambda n: (n.translate(_ASCII_LOWER), n))
+
+
+async def save_plan(tg_id: int, date: str, mode: str | None, items: list[dict],
+                    notes: str | None = None, plan_key: str | None = None,
+                    replace: bool = False) -> tuple[int | None, list[str]]:
+    """
+    Сохранить план одной транзакцией: тренировка + все подходы через executemany.
+    Возвращает (workout_id, упорядоченные названия упражнений) без повторного чтения из БД.
+    Если валидных пунктов нет — ничего не пишет и возвращает (None, []).
+
+    plan_key (см. load_today_plan) делает сохранение идемпотентным: если план с таким ключом
+    уже есть (например, второй тап успел раньше), возвращается он. replace=True — явная
+    перегенерация: нетронутые планы с тем же ключом удаляются, начатые остаются.
+    """
+    rows = plan_rows(items)
+    if not rows:
+        return None, []
+
+    def job(conn):
+        if plan_key and replace:
+            old = [(r[0],) for r in conn.execute(_SQL_UNTOUCHED_PLANS, (tg_id, date, plan_key))]
+            conn.executemany(_SQL_DELETE_EXERCISES, old)
+            conn.executemany(_SQL_DELETE_WORKOUT, old)
+        elif plan_key:
+            row = conn.execute(_SQL_PLAN_BY_KEY, (tg_id, date, plan_key)).fetchone()
+            if row:
+                names = list(dict.fromkeys(r["name"] for r in conn.execute(_SQL_WORKOUT_SETS, (row["id"],))))
+                return row["id"], names
+        workout_id = conn.execute(_SQL_WORKOUT_INSERT, (tg_id, date, notes, plan_key)).lastrowid
+        conn.executemany(_SQL_EXERCISE_INSERT, [(workout_id, *r, date, mode) for r in rows])
+        return workout_id, None
+    workout_id, names = await get_db().run(job)
+    return workout_id, names if names is not None else plan_names(rows)
+
+
+async def start_plan(tg_id: int, date: str, notes: str | None = None, plan_key: str | None = None,
+                     replace: bool = False) -> tuple[int, bool]:
+    """
+    Заготовка плана для пошагового сохранения (стриминг): пустая тренировка, подходы
+    добавляет add_plan_items. plan_key/replace — как в save_plan.
+    Возвращает (workout_id, existed): existed=True — план с этим ключом уже есть, новый не создан.
+    """
+    def job(conn):
+        if plan_key and replace:
+            old = [(r[0],) for r in conn.execute(_SQL_UNTOUCHED_PLANS, (tg_id, date, plan_key))]
+            conn.executemany(_SQL_DELETE_EXERCISES, old)
+            conn.executemany(_SQL_DELETE_WORKOUT, old)
+        elif plan_key:
+            row = conn.execute(_SQL_PLAN_BY_KEY, (tg_id, date, plan_key)).fetchone()
+            if row:
+                return row["id"], True
+        return conn.execute(_SQL_WORKOUT_INSERT, (tg_id, date, notes, plan_key)).lastrowid, False
+    return await get_db().run(job)
+
+
+async def add_plan_items(workout_id: int, date: str, mode: str | None, items: list[dict]) -> list[tuple]:
+    """Дописать к плану валидные пункты items; вернуть записанные строки plan_rows."""
+    rows = plan_rows(items)
+    if rows:
+        await get_db().run(lambda conn: conn.executemany(
+            _SQL_EXERCISE_INSERT, [(workout_id, *r, date, mode) for r in rows]))
+    return rows
+
+
+# --- today's plan cache --------------------------------------------------------
+
+class TodayPlan(NamedTuple):
+    plan_key: str
+    workout_id: int | None      # сохранённый сегодня план с тем же ключом — генерировать не нужно
+    payload: dict | None        # payload для планировщика, если плана нет (или force)
+    user_prompt: str | None
+    prompt_hash: str | None = None  # users.prompt_hash для user_prompt
+
+
+def plan_key(tg_id: int, date: str, source: str, user: sqlite3.Row | None, history: list,
+             salt: str = "") -> str:
+    """
+    Отпечаток входа планировщика: пользователь, дата, источник (local/ai), профиль с анкетой
+    и промптом, история до сегодняшнего дня. Сегодняшние подходы (в том числе внесённые
+    повторы этого же плана) в ключ не входят — иначе он менялся бы после каждого ввода.
+    """
+    h = hashlib.sha256(repr((tg_id, date, source, salt, tuple(user) if user else None)).encode())
+    for r in history:
+        if r["date"] < date:
+            h.update(repr(tuple(r)).encode())
+    return h.hexdigest()
+
+
+async def load_today_plan(tg_id: int, date: str, source: str, salt: str = "", force: bool = False,
+                          days: int = HISTORY_DAYS) -> TodayPlan:
+    """
+    Как load_planner_payload, но сначала ищет уже сохранённый на date план с тем же отпечатком
+    (plan_key) — тогда payload не собирается, а планировщик/LLM вызывать не нужно.
+    force=True — явная перегенерация: поиск пропускается.
+    """
+    since = (_date.fromisoformat(date) - timedelta(days=days)).strftime("%Y-%m-%d")
+
+    def job(conn):
+        user = conn.execute(_SQL_PLANNER_USER, (tg_id,)).fetchone()
+        history = _history(conn, tg_id, since, user["training_type"] if user else None)
+        key = plan_key(tg_id, date, source, user, history, salt)
+        if not force:
+            row = conn.execute(_SQL_PLAN_BY_KEY, (tg_id, date, key)).fetchone()
+            if row:
+                return key, row["id"], None, None
+        return key, None, user, history
+    key, workout_id, user, history = await get_db().run(job)
+    if workout_id:
+        return TodayPlan(key, workout_id, None, None)
+    return TodayPlan(key, None, build_planner_payload(user, history),
+                     user["prompt"] if user else None, user["prompt_hash"] if user else None)
+
+
+async def get_today_names(tg_id: int, date: str) -> list[str]:
+    """Упражнения пользователя за дату с учётом его текущего training_type."""
+    def job(conn):
+        mrow = conn.execute(_SQL_USER_TYPE, (tg_id,)).fetchone()
+        mode_val = mrow["training_type"] if mrow else None
+        if mode_val:
+            rows = conn.execute(_SQL_TODAY_NAMES_BY_TYPE, (tg_id, date, mode_val)).fetchall()
+        else:
+            rows = conn.execute(_SQL_TODAY_NAMES, (tg_id, date)).fetchall()
+        return [r[0] for r in rows]
+    return await get_db().run(job)
+
+
+def _exercise_sets(conn, tg_id: int, name: str, workout_id: int | None, date: str | None) -> list[sqlite3.Row]:
+    if workout_id:
+        return conn.execute(_SQL_SETS_BY_WORKOUT, (workout_id, tg_id, name)).fetchall()
+    return conn.execute(_SQL_SETS_BY_DATE, (tg_id, date, name)).fetchall()
+
+
+async def get_exercise_sets(tg_id: int, name: str, workout_id: int | None = None,
+                            date: str | None = None) -> list[sqlite3.Row]:
+    """Подходы упражнения: по workout_id, а если его нет — по дате."""
+    return await get_db().run(_exercise_sets, tg_id, name, workout_id, date)
+
+
+async def save_actual_reps(tg_id: int, name: str, reps: list[int], workout_id: int | None = None,
+                           date: str | None = None) -> tuple[int, list[sqlite3.Row]] | None:
+    """
+    Записать выполненные повторения по порядку сетов.
+    Возвращает (сколько сохранено, обновлённые подходы) или None, если подходов нет.
+    """
+    def job(conn):
+        rows = _exercise_sets(conn, tg_id, name, workout_id, date)
+        if not rows:
+            return None
+        params = [(r, row["id"]) for r, row in zip(reps, rows)]
+        conn.executemany(_SQL_SET_ACTUAL, params)
+        return len(params), _exercise_sets(conn, tg_id, name, workout_id, date)
+    return await get_db().run(job)
+
+
+async def delete_workout(tg_id: int, workout_id: int) -> bool:
+    """Удалить тренировку пользователя. False — если её нет или она чужая."""
+    def job(conn):
+        row = conn.execute(_SQL_WORKOUT, (workout_id, tg_id)).fetchone()
+        if not row:
+            return False
+        conn.execute(_SQL_DELETE_EXERCISES, (workout_id,))
+        conn.execute(_SQL_DELETE_WORKOUT, (workout_id,))
+        return True
+    return await get_db().run(job)
@@ -0,0 +1,131 @@
+"""
+Устойчивые вызовы внешних API: повторы с экспоненциальной задержкой и джиттером,
+общий дедлайн и circuit breaker.
+
+Breaker считает подряд идущие сбои; после failures штук он «размыкается» и reset_after
+секунд сразу отвечает CircuitOpenError, не тратя ни времени пользователя, ни слотов.
+Затем пропускает один пробный вызов (half-open): успех замыкает цепь, сбой — снова размыкает.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from services.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_breakers: list["CircuitBreaker"] = []
+
+
+class CircuitOpenError(RuntimeError):
+    """Цепь разомкнута: вызов не выполнялся."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = 5, reset_after: float = 60.0):
+        self.name = name
+        self.failures = max(1, failures)
+        self.reset_after = reset_after
+        self._failed = 0
+        self._opened_at: float | None = None
+        self._probe = False             # в half-open пробный вызов уже идёт
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "retries": 0, "opened": 0}
+        _breakers.append(self)
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def before_call(self):
+        """CircuitOpenError, если цепь разомкнута (или пробный вызов half-open уже занят)."""
+        state = self.state
+        if state == "open" or (state == "half-open" and self._probe):
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(f"{self.name}: circuit open")
+        if state == "half-open":
+            self._probe = True
+        self.stats["calls"] += 1
+
+    def success(self):
+        if self._opened_at is not None:
+            logger.info("%s: цепь снова замкнута", self.name)
+        self._failed = 0
+        self._opened_at = None
+        self._probe = False
+
+    def failure(self):
+        self.stats["failures"] += 1
+        self._failed += 1
+        half_open = self._probe
+        self._probe = False
+        if half_open or (self._opened_at is None and self._failed >= self.failures):
+            self._opened_at = time.monotonic()
+            self.stats["opened"] += 1
+            logger.warning("%s: %d сбоев подряд — цепь разомкнута на %.0fs", self.name, self._failed, self.reset_after)
+
+    def release(self):
+        """Вызов не состоялся (отмена) — пробный слот half-open освобождается без вердикта."""
+        self._probe = False
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full jitter: случайная задержка в [0, min(cap, base·2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def call_with_retry(fn: Callable[[], Awaitable[T]], *, breaker: CircuitBreaker | None = None,
+                          attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                          deadline: float | None = None,
+                          retry_on: tuple[type[BaseException], ...] = (Exception,),
+                          can_retry: Callable[[], bool] = lambda: True) -> T:
+    """
+    fn() до attempts раз. Повтор — только для исключений retry_on и пока can_retry()
+    (например, пока стрим не успел ничего отдать). deadline — time.monotonic(), после
+    которого новых попыток не начинаем: задержка, не влезающая в него, = отказ с последней ошибкой.
+    Сбои из retry_on считаются breaker'ом; остальные ошибки (неверный запрос) — нет.
+    """
+    for attempt in range(max(1, attempts)):
+        if breaker:
+            breaker.before_call()
+        try:
+            result = await fn()
+        except retry_on as e:
+            if breaker:
+                breaker.failure()
+            last = attempt == attempts - 1
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if last or not can_retry() or (deadline is not None and time.monotonic() + delay >= deadline) \
+                    or (breaker and breaker.state != "closed"):
+                raise
+            logger.warning("%s: попытка %d/%d не удалась (%s: %s), повтор через %.2fs",
+                           breaker.name if breaker else "call", attempt + 1, attempts, type(e).__name__, e, delay)
+            if breaker:
+                breaker.stats["retries"] += 1
+            await asyncio.sleep(delay)
+        except BaseException:
+            if breaker:
+                breaker.release()
+            raise
+        else:
+            if breaker:
+                breaker.success()
+            return result
+    raise AssertionError("unreachable")
+
+
+def _metrics():
+    out = []
+    for b in _breakers:
+        labels = {"name": b.name}
+        out.append(("trainer_circuit_open", labels, 0 if b.state == "closed" else 1))
+        out += [(f"trainer_circuit_{k}_total", labels, v) for k, v in b.stats.items()]
+    return out
+
+
+register_collector(_metrics)
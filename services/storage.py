@@ -0,0 +1,189 @@
+"""
+Персистентное состояние бота в той же SQLite-базе, что и данные:
+- SQLiteStorage — FSM-хранилище aiogram (онбординг, анкета, редактирование профиля);
+- SessionStore — сессии хендлеров плана (какой план открыт, какой ввод ожидается).
+Записи читаются лениво, по ключу, только когда хендлеру они понадобились; у каждой есть
+срок жизни (TTL), просроченные считаются отсутствующими и периодически удаляются.
+Благодаря этому состояние переживает рестарт и доступно нескольким воркерам.
+Горячие сессии дополнительно держатся в ограниченном кеше в памяти (utils.session_cache).
+"""
+import json
+import time
+from typing import Any, Mapping
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_STORAGE, FSM_TTL, SESSION_TTL, SESSION_CACHE_SIZE, SESSION_CACHE_TTL, SESSION_ABSENT_TTL
+from db import get_db
+from services.metrics import register_collector
+from utils.session_cache import SessionCache
+
+# как часто (в операциях записи) подчищать просроченные записи
+_PURGE_EVERY = 500
+
+
+def _expires_at(ttl: float | None) -> float | None:
+    return time.time() + ttl if ttl else None
+
+
+# --- FSM ---------------------------------------------------------------------
+
+_SQL_FSM_STATE = "SELECT state FROM fsm_storage WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)"
+_SQL_FSM_DATA = "SELECT data FROM fsm_storage WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)"
+# у просроченной записи при обновлении одной половины сбрасываем вторую
+_SQL_FSM_SET_STATE = """
+    INSERT INTO fsm_storage(key, state, data, expires_at) VALUES (?, ?, '{}', ?)
+    ON CONFLICT(key) DO UPDATE SET
+        state = excluded.state,
+        data = CASE WHEN fsm_storage.expires_at IS NOT NULL AND fsm_storage.expires_at <= ? THEN '{}' ELSE fsm_storage.data END,
+        expires_at = excluded.expires_at
+"""
+_SQL_FSM_SET_DATA = """
+    INSERT INTO fsm_storage(key, state, data, expires_at) VALUES (?, NULL, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        state = CASE WHEN fsm_storage.expires_at IS NOT NULL AND fsm_storage.expires_at <= ? THEN NULL ELSE fsm_storage.state END,
+        data = excluded.data,
+        expires_at = excluded.expires_at
+"""
+_SQL_FSM_DROP_EMPTY = "DELETE FROM fsm_storage WHERE key = ? AND state IS NULL AND data = '{}'"
+_SQL_FSM_PURGE = "DELETE FROM fsm_storage WHERE expires_at IS NOT NULL AND expires_at <= ?"
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram поверх таблицы fsm_storage (см. db.init_db)."""
+
+    def __init__(self, ttl: float | None = FSM_TTL, key_builder: KeyBuilder | None = None):
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(
+            with_bot_id=True, with_business_connection_id=True, with_destiny=True,
+        )
+        self._writes = 0
+
+    def _write(self, conn, sql: str, params: tuple, key: str, now: float):
+        conn.execute(sql, params)
+        conn.execute(_SQL_FSM_DROP_EMPTY, (key,))
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            conn.execute(_SQL_FSM_PURGE, (now,))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self.key_builder.build(key)
+        value = state.state if isinstance(state, State) else state
+        now = time.time()
+        await get_db().run(self._write, _SQL_FSM_SET_STATE, (k, value, _expires_at(self.ttl), now), k, now)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        row = await get_db().fetchone(_SQL_FSM_STATE, (self.key_builder.build(key), time.time()))
+        return row["state"] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        k = self.key_builder.build(key)
+        payload = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        await get_db().run(self._write, _SQL_FSM_SET_DATA, (k, payload, _expires_at(self.ttl), now), k, now)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        row = await get_db().fetchone(_SQL_FSM_DATA, (self.key_builder.build(key), time.time()))
+        return json.loads(row["data"]) if row and row["data"] else {}
+
+    async def close(self) -> None:
+        # соединение общее (db.get_db), его закрывает main
+        pass
+
+
+def create_fsm_storage() -> BaseStorage:
+    """FSM-хранилище по config.FSM_STORAGE: "sqlite" (по умолчанию) или "memory"."""
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return SQLiteStorage()
+
+
+# --- sessions ----------------------------------------------------------------
+
+_SQL_SESSION_GET = "SELECT data FROM sessions WHERE tg_id = ? AND kind = ? AND (expires_at IS NULL OR expires_at > ?)"
+_SQL_SESSION_SET = """
+    INSERT INTO sessions(tg_id, kind, data, expires_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(tg_id, kind) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+"""
+_SQL_SESSION_DELETE = "DELETE FROM sessions WHERE tg_id = ? AND kind = ?"
+_SQL_SESSION_PURGE = "DELETE FROM sessions WHERE expires_at IS NOT NULL AND expires_at <= ?"
+
+# в кеше: «сессии нет» — чтобы F.text-хендлер не ходил в SQLite на каждое сообщение без ожидаемого ввода
+_ABSENT = object()
+
+
+class SessionStore:
+    """
+    Сессии одного вида (kind) по tg_id: JSON-словарь с TTL в таблице sessions.
+    Заменяет словари на уровне модуля, которые терялись при рестарте и росли без ограничений.
+    Перед базой стоит SessionCache: запись идёт в обе стороны, чтение — сначала из памяти.
+    Отсутствие сессии тоже кешируется (на SESSION_ABSENT_TTL), set/pop его сбрасывают.
+    При нескольких воркерах кеш стоит выключить (SESSION_CACHE_SIZE=0), иначе воркер
+    может прочитать устаревшую сессию.
+    """
+
+    def __init__(self, kind: str, ttl: float | None = SESSION_TTL, cache: SessionCache | None = None):
+        self.kind = kind
+        self.ttl = ttl
+        if cache is None:
+            cache_ttl = min(SESSION_CACHE_TTL, ttl) if ttl else SESSION_CACHE_TTL
+            cache = SessionCache(maxsize=SESSION_CACHE_SIZE, ttl=cache_ttl)
+        self.cache = cache
+        self.absent_ttl = min(SESSION_ABSENT_TTL, cache.ttl)
+        self._writes = 0
+        self._version = 0   # растёт при set/pop: чтение, начатое до записи, не кладёт в кеш устаревшее
+        register_collector(self._metrics)
+
+    async def get(self, tg_id: int) -> dict | None:
+        value = self.cache.get(tg_id)
+        if value is not None:
+            return None if value is _ABSENT else value
+        version = self._version
+        row = await get_db().fetchone(_SQL_SESSION_GET, (tg_id, self.kind, time.time()))
+        value = json.loads(row["data"]) if row else None
+        if version == self._version:
+            if value is None:
+                self.cache.set(tg_id, _ABSENT, ttl=self.absent_ttl)
+            else:
+                self.cache.set(tg_id, value)
+        return value
+
+    async def set(self, tg_id: int, value: dict) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        self._version += 1
+        version = self._version
+        self._writes += 1
+        purge = self._writes % _PURGE_EVERY == 0
+
+        def job(conn):
+            conn.execute(_SQL_SESSION_SET, (tg_id, self.kind, payload, _expires_at(self.ttl)))
+            if purge:
+                conn.execute(_SQL_SESSION_PURGE, (time.time(),))
+        await get_db().run(job)
+        # пока шла запись, мог пройти pop/set того же пользователя — тогда кеш уже не наш;
+        # в кеш — копия из payload, а не словарь вызывающего (он может менять его дальше)
+        if version == self._version:
+            self.cache.set(tg_id, json.loads(payload))
+
+    async def pop(self, tg_id: int) -> None:
+        self._version += 1
+        self.cache.pop(tg_id)
+        await get_db().execute(_SQL_SESSION_DELETE, (tg_id, self.kind))
+
+    def stats(self) -> dict:
+        return {"kind": self.kind, **self.cache.stats()}
+
+    def _metrics(self):
+        st, labels = self.cache.stats(), {"kind": self.kind}
+        return [
+            ("trainer_session_cache_size", labels, st["size"]),
+            ("trainer_session_cache_hits_total", labels, st["hits"]),
+            ("trainer_session_cache_misses_total", labels, st["misses"]),
+            ("trainer_session_cache_evictions_total", labels, st["evictions"]),
+        ]
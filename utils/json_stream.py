@@ -0,0 +1,128 @@
+"""
+Инкрементальный и терпимый разбор JSON-массива объектов из ответа LLM.
+
+    parser = JsonArrayStream()
+    for chunk in chunks:
+        for obj in parser.feed(chunk):
+            ...
+
+Каждый объект верхнего уровня первого массива отдаётся, как только закрылась его «}»,
+не дожидаясь конца ответа. Поэтому от оборванного ответа остаётся валидный префикс.
+Текст до массива (```json, пояснения модели, {"items": ...}) пропускается; «массив»
+из прозы без объектов ([на сегодня]) не считается. Висячие запятые (`{"a": 1,}`) чинятся.
+extract_objects(text) — то же для целого текста, с быстрым путём через json.loads.
+"""
+import json
+import re
+
+# «,» перед «}»/«]» вне строк: (строка JSON) | (висячая запятая)
+_TRAILING_COMMA = re.compile(r'("(?:[^"\\]|\\.)*")|,\s*(?=[}\]])')
+
+
+def _loads_lenient(s: str):
+    try:
+        return json.loads(s)
+    except ValueError:
+        return json.loads(_TRAILING_COMMA.sub(lambda m: m.group(1) or "", s))
+
+
+class JsonArrayStream:
+    __slots__ = ("_buf", "_pos", "_depth", "_in_str", "_esc", "_obj_start", "_found", "_done", "skipped")
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0           # до какого символа _buf уже просмотрен
+        self._depth = 0         # 0 — до массива, 1 — внутри массива, 2+ — внутри объекта
+        self._in_str = False
+        self._esc = False
+        self._obj_start = -1    # начало текущего объекта верхнего уровня в _buf
+        self._found = 0         # объектов в текущем массиве
+        self._done = False      # массив закрыт — остальное игнорируем
+        self.skipped = 0        # объектов, которые не удалось разобрать даже после починки
+
+    def feed(self, chunk: str) -> list:
+        """Добавить кусок текста, вернуть объекты, завершённые в нём."""
+        if self._done or not chunk:
+            return []
+        self._buf += chunk
+        out = []
+        buf, i = self._buf, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif self._depth == 0:
+                if ch == "[":
+                    self._depth = 1
+            elif ch == '"':
+                # строки отслеживаем и на уровне массива: «]» внутри строки его не закрывает
+                self._in_str = True
+            elif ch in "{[":
+                if self._depth == 1:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._obj_start >= 0:
+                    try:
+                        obj = _loads_lenient(buf[self._obj_start:i + 1])
+                    except ValueError:
+                        self.skipped += 1
+                    else:
+                        self._found += 1
+                        out.append(obj)
+                    self._obj_start = -1
+                elif self._depth <= 0:
+                    if self._found:
+                        self._done = True
+                        break
+                    # скобки из прозы — ищем настоящий массив дальше
+                    self._depth = 0
+            i += 1
+        # разобранное целиком выбрасываем, чтобы буфер не рос на длинных ответах
+        cut = self._obj_start if self._obj_start >= 0 else i
+        self._buf, self._pos = buf[cut:], i - cut
+        if self._obj_start >= 0:
+            self._obj_start = 0
+        return out
+
+    @property
+    def complete(self) -> bool:
+        """Массив закрыт — ответ не оборван."""
+        return self._done
+
+
+def _first_object_list(obj):
+    """Первый список объектов в JSON: сам список или значение вроде {"items": [...]}."""
+    if isinstance(obj, list):
+        return obj
+    if isinstance(obj, dict):
+        for v in obj.values():
+            found = _first_object_list(v) if isinstance(v, (list, dict)) else None
+            if found is not None and all(isinstance(x, dict) for x in found):
+                return found
+    return None
+
+
+def extract_objects(text: str) -> tuple[list, bool]:
+    """
+    Объекты первого массива в тексте ответа. Возвращает (objects, clean): clean=False —
+    пришлось восстанавливать (проза вокруг, висячие запятые, оборванный хвост, битые элементы).
+    """
+    s = text.strip()
+    if s.startswith("```"):
+        s = s.strip("`").removeprefix("json").strip()
+    try:
+        found = _first_object_list(json.loads(s))
+        if found is not None:
+            return found, True
+    except ValueError:
+        pass
+    parser = JsonArrayStream()
+    objects = parser.feed(text)
+    return objects, False
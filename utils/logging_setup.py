@@ -0,0 +1,99 @@
+"""
+Логирование бота: уровни, ленивое форматирование, неблокирующий вывод.
+
+setup_logging() вешает на root один QueueHandler: запись в поток вывода делает
+отдельный поток QueueListener, поэтому хендлеры и event loop не ждут stdout.
+Сообщения пишем с %-аргументами (logger.debug("x=%s", x)) — при выключенном
+уровне строка не собирается вовсе. Большие объекты (payload, ответ LLM) оборачиваем
+в Truncated/LazyJSON: в строку они превращаются только при выводе и обрезаются
+до LOG_MAX_CHARS; sampled() пропускает в лог лишь долю LOG_SAMPLE_RATE таких записей.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_MAX_CHARS, LOG_SAMPLE_RATE
+
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: ts, level, logger, msg (+ exc)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False)
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Настроить root-логгер один раз на процесс (повторный вызов ничего не делает)."""
+    global _listener
+    if _listener is not None:
+        return
+    level_no = logging.getLevelName(level.upper())
+    if not isinstance(level_no, int):
+        level_no = logging.INFO
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if fmt == "json" else
+                        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(q, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    root = logging.getLogger()
+    root.handlers[:] = [QueueHandler(q)]
+    root.setLevel(level_no)
+    # aiogram пишет строку на каждый апдейт; время апдейтов и так есть в services.metrics
+    if level_no > logging.DEBUG:
+        logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+
+def stop_logging():
+    """Дописать очередь и остановить поток вывода."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def sampled(rate: float = LOG_SAMPLE_RATE) -> bool:
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+class Truncated:
+    """str(obj), обрезанный до limit символов — вычисляется только при выводе записи."""
+    __slots__ = ("obj", "limit")
+
+    def __init__(self, obj, limit: int = LOG_MAX_CHARS):
+        self.obj = obj
+        self.limit = limit
+
+    def _text(self) -> str:
+        return str(self.obj)
+
+    def __str__(self) -> str:
+        s = self._text()
+        if self.limit and len(s) > self.limit:
+            return f"{s[:self.limit]}… (+{len(s) - self.limit} символов)"
+        return s
+
+
+class LazyJSON(Truncated):
+    """JSON-представление объекта (с кириллицей как есть), обрезанное до limit."""
+    __slots__ = ()
+
+    def _text(self) -> str:
+        return json.dumps(self.obj, ensure_ascii=False, default=str)
@@ -0,0 +1,24 @@
+"""
+Отпечаток пользовательского промпта. Хранится в users.prompt_hash рядом с users.prompt
+(пишется в repository._update_user, старые строки досчитывает db.init_db), чтобы выбор
+промпта в openai_client._resolve_prompt был поиском по хешу, а не сравнением длинных строк.
+"""
+import hashlib
+
+# значения users.prompt, которые означают «промпт не задан»
+EMPTY_PROMPT_MARKERS = frozenset({"none", "null", "nil", "default", "/default", "auto"})
+
+
+def is_empty_prompt(p) -> bool:
+    """None, пустая строка или маркер пустоты (в любом регистре)."""
+    if p is None:
+        return True
+    s = str(p).strip()
+    return not s or s.lower() in EMPTY_PROMPT_MARKERS
+
+
+def prompt_hash(p) -> str | None:
+    """sha256 промпта без краевых пробелов; None — промпт не задан."""
+    if is_empty_prompt(p):
+        return None
+    return hashlib.sha256(str(p).strip().encode()).hexdigest()